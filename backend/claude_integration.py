@@ -8,6 +8,7 @@ import sys
 import os
 import asyncio
 from pathlib import Path
+from functools import lru_cache
 from typing import Dict, Any, Optional, List
 import logging
 
@@ -28,6 +29,98 @@ else:
     else:
         print(f"❌ Claude SDK não encontrado em nenhum path conhecido")
 
+# Import direto do SDK (evita spawn de um interpretador Python por resumo)
+try:
+    from claude_code_sdk import query as sdk_query, ClaudeCodeOptions, AssistantMessage, TextBlock, ResultMessage
+    SDK_IN_PROCESS = True
+except ImportError:
+    SDK_IN_PROCESS = False
+
+# Tempo máximo de uma geração de resumo (subprocess ou in-process)
+SUMMARY_TIMEOUT = 120
+
+# Linhas de métricas impressas pelo SDK após a resposta
+_METRICS_MARKERS = ("📊 Tokens:", "💰 Custo:")
+
+# Instruções de formato por tipo de resumo (montadas uma única vez no import)
+_BASE_INSTRUCTION = """Analise esta conversa do Claude Code e crie um resumo estruturado em português brasileiro."""
+
+_FORMAT_INSTRUCTIONS = {
+    "conciso": """
+Formato CONCISO (máximo 20 palavras apenas):
+📋 **Contexto**: [tipo de projeto/problema]
+🎯 **Objetivo**: [o que foi solicitado]
+✅ **Resultado**: [o que foi implementado/resolvido]
+🔧 **Tecnologias**: [principais ferramentas]
+
+Resumo ultra-conciso em 20 palavras:""",
+
+    "detalhado": """
+Formato DETALHADO (máximo 400 palavras):
+📋 **Contexto Completo**: [situação e background do projeto]
+🎯 **Objetivos**: [todos os goals e requisitos discutidos]
+⚙️ **Implementação**: [detalhes técnicos, arquitetura, decisões]
+✅ **Resultados**: [tudo que foi entregue e funcionalidades]
+🔧 **Tecnologias**: [stack completo utilizado]
+💡 **Insights**: [aprendizados e decisões importantes]
+🔄 **Próximos Passos**: [se mencionados na conversa]
+
+Resumo detalhado:""",
+
+    "bullet_points": """
+Formato BULLET POINTS:
+📋 **Contexto**:
+   • [ponto 1]
+   • [ponto 2]
+
+🎯 **Objetivos**:
+   • [objetivo 1]
+   • [objetivo 2]
+
+✅ **Implementações**:
+   • [implementação 1]
+   • [implementação 2]
+
+🔧 **Tecnologias**:
+   • [tech 1]
+   • [tech 2]
+
+Lista estruturada:""",
+}
+
+# Default para tipos desconhecidos
+_DEFAULT_FORMAT_INSTRUCTION = """
+Formato (máximo 200 palavras):
+📋 **Contexto**: [projeto/problema]
+🎯 **Objetivo**: [solicitação]
+✅ **Resultado**: [implementação]
+
+Resumo:"""
+
+# Prefixo completo do prompt (instrução base + formato) já concatenado por tipo
+_PROMPT_PREFIXES = {
+    summary_type: f"{_BASE_INSTRUCTION}\n\n{format_instruction}\n\nConversa para análise:\n"
+    for summary_type, format_instruction in _FORMAT_INSTRUCTIONS.items()
+}
+_DEFAULT_PROMPT_PREFIX = f"{_BASE_INSTRUCTION}\n\n{_DEFAULT_FORMAT_INSTRUCTION}\n\nConversa para análise:\n"
+
+# Limites da conversa enviada no prompt
+MAX_CONV_TOKENS = 2000  # Mesmo orçamento dos ~8k chars (≈4 chars por token)
+MAX_CONV_CHARS = 8000   # Usado quando não há tokenizador disponível
+# Só o final da conversa é tokenizado: tokens raramente passam de 8 caracteres
+MAX_CONV_TAIL_CHARS = MAX_CONV_TOKENS * 8
+_TRUNCATION_NOTICE = "[...conversa truncada para mostrar as partes mais recentes...]\n"
+
+@lru_cache(maxsize=1)
+def _get_token_encoder():
+    """Carrega uma única vez o tokenizador BPE (tiktoken), se disponível"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.info(f"tiktoken indisponível, truncando por caracteres: {e}")
+        return None
+
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,38 +128,38 @@ logger = logging.getLogger(__name__)
 class ClaudeViewer:
     """Cliente Claude integrado para o Session Viewer"""
     
+    # Estado de inicialização compartilhado entre instâncias (vale para o processo todo)
+    _initialized = False
+    _claude_cli_path = None
+    _sdk_module_path = None
+    
     def __init__(self):
         self.client = None
-        self._initialized = False
     
     def _initialize_sdk(self):
         """Inicializa o Claude SDK se ainda não foi inicializado"""
-        if self._initialized:
+        if ClaudeViewer._initialized:
             return True
             
         try:
-            # Importar usando subprocess para evitar problemas de path
-            import subprocess
-            import sys
-            
             # Path para o wrapper CLI do Claude
             claude_cli_path = "/home/suthub/.claude/cc-sdk-chat/api/claude-code-sdk-python/wrappers_cli/claude"
             
-            # Testar se o CLI funciona
-            result = subprocess.run([claude_cli_path, "--help"], 
-                                  capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                self._claude_cli_path = claude_cli_path
+            # Verifica se o CLI existe e é executável, sem precisar de fork/exec
+            if os.path.isfile(claude_cli_path) and os.access(claude_cli_path, os.X_OK):
+                ClaudeViewer._claude_cli_path = claude_cli_path
                 logger.info("Claude CLI inicializado com sucesso")
             else:
-                raise Exception(f"Claude CLI retornou código {result.returncode}: {result.stderr}")
+                raise Exception(f"Claude CLI não encontrado ou não executável: {claude_cli_path}")
             
             # Método alternativo - executar Python diretamente no módulo SDK
             sdk_module_path = "/home/suthub/.claude/cc-sdk-chat/api/claude-code-sdk-python"
-            self._sdk_module_path = sdk_module_path
+            ClaudeViewer._sdk_module_path = sdk_module_path
+            
+            # Evita a checagem de versão do CLI (`claude -v`) a cada chamada do SDK
+            os.environ.setdefault('CLAUDE_AGENT_SDK_SKIP_VERSION_CHECK', '1')
             
-            self._initialized = True
+            ClaudeViewer._initialized = True
             logger.info("Claude SDK inicializado com sucesso")
             return True
             
@@ -96,74 +189,50 @@ class ClaudeViewer:
             }
         
         try:
-            # Cria prompt baseado no tipo de resumo
-            prompt = self._create_summary_prompt(conversation_text, summary_type)
+            # Cria prompt baseado no tipo de resumo; fora do event loop compartilhado,
+            # pois a tokenização (e o primeiro carregamento do tiktoken) é bloqueante
+            prompt = await asyncio.to_thread(self._create_summary_prompt, conversation_text, summary_type)
             
             logger.info(f"Gerando resumo tipo: {summary_type}")
             logger.debug(f"Prompt length: {len(prompt)} characters")
             
-            # Executa query usando subprocess para evitar problemas de imports
-            import subprocess
-            import tempfile
-            import json
+            if SDK_IN_PROCESS:
+                return await self._generate_summary_in_process(prompt, summary_type)
             
-            # Executar Claude SDK via subprocess passando prompt diretamente
+            # Executa query usando subprocess assíncrono para não bloquear o event loop
             cmd = ["python3", "-m", "src", prompt]
             
             # Executar no diretório do SDK
-            result = subprocess.run(
-                cmd,
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
                 cwd=self._sdk_module_path,
-                capture_output=True,
-                text=True,
-                timeout=120,
-                env={**os.environ, 'PYTHONPATH': self._sdk_module_path}
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env={
+                    **os.environ,
+                    'PYTHONPATH': self._sdk_module_path,
+                    'CLAUDE_AGENT_SDK_SKIP_VERSION_CHECK': '1'
+                }
             )
             
-            if result.returncode == 0:
-                raw_output = result.stdout.strip()
+            try:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=SUMMARY_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise Exception(f"Claude SDK excedeu o tempo limite de {SUMMARY_TIMEOUT}s")
+            finally:
+                # Timeout ou cancelamento (ex.: limite do _run_async): não deixar o processo órfão
+                if proc.returncode is None:
+                    try:
+                        proc.kill()
+                    except ProcessLookupError:
+                        pass
+                    await proc.wait()
+            
+            if proc.returncode == 0:
+                raw_output = stdout.decode('utf-8', errors='replace').strip()
                 
                 # Extrair apenas a resposta do Claude, removendo header e metadata
-                lines = raw_output.split('\n')
-                
-                # Encontrar onde começa a resposta real do Claude
-                claude_response_start = -1
-                for i, line in enumerate(lines):
-                    if "📝 Claude:" in line and i > 0:
-                        claude_response_start = i + 1
-                        break
-                
-                if claude_response_start > 0:
-                    # Pegar tudo após "📝 Claude:" até antes das métricas
-                    response_lines = []
-                    for i in range(claude_response_start, len(lines)):
-                        line = lines[i]
-                        # Parar quando encontrar métricas
-                        if line.startswith("📊 Tokens:") or line.startswith("💰 Custo:"):
-                            break
-                        response_lines.append(line)
-                    
-                    summary_content = '\n'.join(response_lines).strip()
-                    
-                    # Se não conseguiu extrair resposta limpa, usar fallback
-                    if not summary_content or len(summary_content) < 50:
-                        # Buscar por padrões alternativos
-                        for line in lines:
-                            if "**Contexto**:" in line:
-                                # Encontrou início do resumo estruturado
-                                idx = lines.index(line)
-                                summary_lines = lines[idx:]
-                                # Parar nas métricas
-                                clean_lines = []
-                                for sline in summary_lines:
-                                    if sline.startswith("📊 Tokens:") or sline.startswith("💰 Custo:"):
-                                        break
-                                    clean_lines.append(sline)
-                                summary_content = '\n'.join(clean_lines).strip()
-                                break
-                else:
-                    # Fallback: usar output completo se não conseguir extrair
-                    summary_content = raw_output
+                summary_content = self._extract_summary_content(raw_output)
                 
                 # Métricas básicas (estimativas melhoradas)
                 input_tokens = len(prompt) // 4  # Estimativa: ~4 chars por token
@@ -172,7 +241,8 @@ class ClaudeViewer:
                 
                 logger.info(f"Resumo extraído: {len(summary_content)} chars (de {len(raw_output)} total)")
             else:
-                raise Exception(f"Claude SDK erro (código {result.returncode}): {result.stderr}")
+                error_output = stderr.decode('utf-8', errors='replace')
+                raise Exception(f"Claude SDK erro (código {proc.returncode}): {error_output}")
             
             logger.info(f"Resumo gerado com sucesso - {len(summary_content)} chars")
             
@@ -196,80 +266,117 @@ class ClaudeViewer:
                 "summary": ""
             }
     
-    def _create_summary_prompt(self, conversation_text: str, summary_type: str) -> str:
-        """Cria prompt otimizado baseado no tipo de resumo"""
+    def _find_metrics_start(self, text: str, line_start: int) -> int:
+        """Retorna o início da primeira linha de métricas a partir de line_start (ou len(text))"""
+        end = len(text)
+        for marker in _METRICS_MARKERS:
+            if text.startswith(marker, line_start):
+                return line_start
+            pos = text.find("\n" + marker, line_start)
+            if 0 <= pos < end:
+                end = pos
+        return end
+    
+    def _extract_summary_content(self, raw_output: str) -> str:
+        """Extrai a resposta do Claude do stdout do SDK usando buscas diretas na string"""
+        # O marcador da resposta nunca está na primeira linha (header do SDK)
+        first_newline = raw_output.find("\n")
+        marker = raw_output.find("📝 Claude:", first_newline + 1) if first_newline >= 0 else -1
+        if marker < 0:
+            # Fallback: usar output completo se não conseguir extrair
+            return raw_output
         
-        base_instruction = """Analise esta conversa do Claude Code e crie um resumo estruturado em português brasileiro."""
+        # Pegar tudo após a linha "📝 Claude:" até antes das métricas
+        start = raw_output.find("\n", marker)
+        start = start + 1 if start >= 0 else len(raw_output)
+        summary_content = raw_output[start:self._find_metrics_start(raw_output, start)].strip()
         
-        if summary_type == "conciso":
-            format_instruction = """
-Formato CONCISO (máximo 20 palavras apenas):
-📋 **Contexto**: [tipo de projeto/problema]
-🎯 **Objetivo**: [o que foi solicitado]
-✅ **Resultado**: [o que foi implementado/resolvido]
-🔧 **Tecnologias**: [principais ferramentas]
-
-Resumo ultra-conciso em 20 palavras:"""
-            
-        elif summary_type == "detalhado":
-            format_instruction = """
-Formato DETALHADO (máximo 400 palavras):
-📋 **Contexto Completo**: [situação e background do projeto]
-🎯 **Objetivos**: [todos os goals e requisitos discutidos]
-⚙️ **Implementação**: [detalhes técnicos, arquitetura, decisões]
-✅ **Resultados**: [tudo que foi entregue e funcionalidades]
-🔧 **Tecnologias**: [stack completo utilizado]
-💡 **Insights**: [aprendizados e decisões importantes]
-🔄 **Próximos Passos**: [se mencionados na conversa]
-
-Resumo detalhado:"""
-            
-        elif summary_type == "bullet_points":
-            format_instruction = """
-Formato BULLET POINTS:
-📋 **Contexto**:
-   • [ponto 1]
-   • [ponto 2]
-
-🎯 **Objetivos**:
-   • [objetivo 1]
-   • [objetivo 2]
-
-✅ **Implementações**:
-   • [implementação 1]
-   • [implementação 2]
-
-🔧 **Tecnologias**:
-   • [tech 1]
-   • [tech 2]
-
-Lista estruturada:"""
+        # Se não conseguiu extrair resposta limpa, buscar pelo início do resumo estruturado
+        if len(summary_content) < 50:
+            context = raw_output.find("**Contexto**:")
+            if context >= 0:
+                line_start = raw_output.rfind("\n", 0, context) + 1
+                summary_content = raw_output[line_start:self._find_metrics_start(raw_output, line_start)].strip()
         
-        else:
-            # Default para conciso
-            format_instruction = """
-Formato (máximo 200 palavras):
-📋 **Contexto**: [projeto/problema]
-🎯 **Objetivo**: [solicitação]
-✅ **Resultado**: [implementação]
-
-Resumo:"""
+        return summary_content
+    
+    async def _generate_summary_in_process(self, prompt: str, summary_type: str) -> Dict[str, Any]:
+        """Gera resumo chamando o Claude SDK diretamente no processo atual"""
+        text_parts = []
+        usage = {}
+        cost = None
         
-        # Limita o tamanho da conversa para evitar tokens excessivos
-        max_conv_length = 8000  # ~8k chars para deixar espaço para o prompt
-        if len(conversation_text) > max_conv_length:
-            conversation_text = conversation_text[-max_conv_length:]
-            conversation_text = "[...conversa truncada para mostrar as partes mais recentes...]\n" + conversation_text
+        async def collect():
+            nonlocal usage, cost
+            # Mesmo diretório de trabalho do caminho via subprocess (python3 -m src)
+            messages = sdk_query(prompt=prompt, options=ClaudeCodeOptions(cwd=self._sdk_module_path))
+            try:
+                async for message in messages:
+                    if isinstance(message, AssistantMessage):
+                        for block in message.content:
+                            if isinstance(block, TextBlock):
+                                text_parts.append(block.text)
+                    elif isinstance(message, ResultMessage):
+                        usage = message.usage or {}
+                        cost = message.total_cost_usd
+            finally:
+                # Fecha o gerador já no timeout/cancelamento: encerra o CLI iniciado pelo SDK
+                await messages.aclose()
         
-        prompt = f"""{base_instruction}
-
-{format_instruction}
-
-Conversa para análise:
-{conversation_text}
-"""
+        try:
+            await asyncio.wait_for(collect(), timeout=SUMMARY_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise Exception(f"Claude SDK excedeu o tempo limite de {SUMMARY_TIMEOUT}s")
+        
+        summary_content = "".join(text_parts).strip()
+        
+        # Usa métricas reais do SDK quando disponíveis, senão estimativas
+        input_tokens = usage.get("input_tokens", len(prompt) // 4)
+        output_tokens = usage.get("output_tokens", len(summary_content) // 4)
+        if cost is None:
+            cost = (input_tokens * 0.000003) + (output_tokens * 0.000015)
+        
+        logger.info(f"Resumo gerado in-process - {len(summary_content)} chars")
+        
+        return {
+            "success": True,
+            "summary": summary_content,
+            "type": summary_type,
+            "metrics": {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cost": cost,
+                "summary_length": len(summary_content)
+            }
+        }
+    
+    def _truncate_conversation(self, conversation_text: str) -> str:
+        """Mantém apenas o final da conversa, limitado por tokens (ou chars sem tiktoken)"""
+        # Cada token tem ao menos 1 caractere: textos curtos nunca precisam ser tokenizados
+        if len(conversation_text) <= MAX_CONV_TOKENS:
+            return conversation_text
+        
+        encoder = _get_token_encoder()
+        if encoder is not None:
+            # Cortar por caracteres antes: encode() de conversas de vários MB é caro
+            tail = conversation_text[-MAX_CONV_TAIL_CHARS:]
+            tokens = encoder.encode(tail, disallowed_special=())
+            if len(tokens) <= MAX_CONV_TOKENS:
+                return tail if len(tail) == len(conversation_text) else _TRUNCATION_NOTICE + tail
+            return _TRUNCATION_NOTICE + encoder.decode(tokens[-MAX_CONV_TOKENS:])
+        
+        if len(conversation_text) <= MAX_CONV_CHARS:
+            return conversation_text
+        return _TRUNCATION_NOTICE + conversation_text[-MAX_CONV_CHARS:]
+    
+    def _create_summary_prompt(self, conversation_text: str, summary_type: str) -> str:
+        """Cria prompt otimizado baseado no tipo de resumo"""
+        
+        # Limita o tamanho da conversa para evitar tokens excessivos
+        conversation_text = self._truncate_conversation(conversation_text)
         
-        return prompt
+        prefix = _PROMPT_PREFIXES.get(summary_type, _DEFAULT_PROMPT_PREFIX)
+        return prefix + conversation_text + "\n"
     
     def test_connection(self) -> Dict[str, Any]:
         """Testa a conexão com Claude SDK"""
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Utilitários JSON para o Session Viewer
+Usa orjson quando disponível, com fallback para a biblioteca padrão
+"""
+
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # orjson.JSONDecodeError é subclasse de json.JSONDecodeError
+    JSONDecodeError = orjson.JSONDecodeError
+    loads = orjson.loads
+else:
+    JSONDecodeError = json.JSONDecodeError
+    loads = json.loads
+
+# Buffer de leitura dos .jsonl (linhas de sessões costumam ter dezenas de KB)
+JSONL_READ_BUFFER = 1024 * 1024
+
+def dumps(obj, pretty: bool = False) -> bytes:
+    """Serializa para bytes UTF-8 (pretty=True equivale a indent=2)"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if pretty else None, ensure_ascii=False).encode('utf-8')
+
+def iter_jsonl_lines(file_path: str):
+    """
+    Itera as linhas (bytes, com a quebra de linha final) de um arquivo .jsonl
+    
+    Leitura bufferizada em modo binário (sem decodificar para str). Não usa
+    mmap: os .jsonl das sessões ativas são truncados/reescritos pela CLI
+    enquanto são lidos, e acessar páginas além do novo fim do arquivo
+    mapeado gera SIGBUS e derruba o processo.
+    """
+    with open(file_path, 'rb', buffering=JSONL_READ_BUFFER) as file:
+        yield from file
+
+def iter_jsonl_records(lines, on_error=None):
+    """
+    Decodifica linhas .jsonl (bytes, ex.: de iter_jsonl_lines), pulando as vazias
+    
+    Linhas inválidas são ignoradas e passadas para on_error(número da linha, erro).
+    Parar a iteração deixa as linhas seguintes em `lines`, que pode continuar
+    sendo consumido sem parsing.
+    """
+    for line_num, line in enumerate(lines, 1):
+        if not line or line.isspace():
+            continue
+        try:
+            record = loads(line)
+        except JSONDecodeError as e:
+            if on_error is not None:
+                on_error(line_num, e)
+            continue
+        yield record
+
+def count_sessions(projects_path) -> int:
+    """Conta os .jsonl de sessão em <projects_path>/<diretório>/ (scandir, sem stat por arquivo)"""
+    count = 0
+    with os.scandir(projects_path) as entries:
+        for directory in entries:
+            if directory.is_dir():
+                with os.scandir(directory.path) as files:
+                    count += sum(1 for f in files if f.name.endswith(".jsonl"))
+    return count
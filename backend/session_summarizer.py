@@ -4,52 +4,182 @@ Session Summarizer for Claude Viewer
 Processamento de sessões .jsonl para geração de resumos inteligentes
 """
 
-import json
+import os
 import asyncio
 import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from concurrent.futures import Future
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 import logging
 
+import json_utils
 from claude_integration import get_claude_viewer
 
+# Parser ISO 8601 em C (opcional); aceita o sufixo Z diretamente
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
+
 logger = logging.getLogger(__name__)
 
 CLAUDE_PROJECTS_PATH = Path("/home/suthub/.claude/projects")
 
+# Texto das conversas já extraído, em <diretório>/<sessão>.conv.txt; fica fora de
+# CLAUDE_PROJECTS_PATH para não alterar o mtime dos diretórios de sessões
+CONVERSATION_CACHE_PATH = Path("/home/suthub/.claude/viewer-cache/conversations")
+
+# Número máximo de resumos mantidos no cache em memória (LRU)
+SUMMARY_CACHE_MAX = 256
+
+# Versão do formato dos .conv.txt; mudar quando a extração mudar (ex.: prefixos)
+# v2: cabeçalho inclui tamanho e hash do corpo
+CONVERSATION_CACHE_VERSION = b"v2"
+
+def _parse_timestamp(timestamp: str) -> datetime:
+    """Converte timestamp ISO 8601 das sessões em datetime"""
+    if ciso8601 is not None:
+        return ciso8601.parse_datetime(timestamp)
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+def _read_session_messages(file_path: str) -> List[Dict]:
+    """Lê e decodifica todas as linhas de um .jsonl"""
+    def on_error(line_num, e):
+        logger.warning(f"Erro linha {line_num} em {file_path}: {e}")
+    
+    return list(json_utils.iter_jsonl_records(json_utils.iter_jsonl_lines(file_path), on_error))
+
+class _JsonlReader:
+    """
+    Leitura coalescida dos .jsonl de sessão
+    
+    Leituras simultâneas do mesmo arquivo (mesmo mtime/size) esperam um único
+    parsing. Nada é retido depois: o .conv.txt já cobre as leituras repetidas,
+    e só há parsing quando o arquivo mudou.
+    O resultado é compartilhado entre as chamadas coalescidas e não deve ser modificado.
+    """
+    
+    def __init__(self):
+        self.inflight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+    
+    def read(self, file_path: str, mtime_ns: int, size: int) -> List[Dict]:
+        key = (file_path, mtime_ns, size)
+        with self._lock:
+            fut = self.inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = self.inflight[key] = Future()
+        
+        if not owner:
+            return fut.result()
+        
+        try:
+            messages = _read_session_messages(file_path)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(messages)
+            return messages
+        finally:
+            with self._lock:
+                del self.inflight[key]
+
+_session_reader = _JsonlReader()
+
+def _append_user_message(msg: Dict, parts: List[str]):
+    """Acrescenta uma mensagem do usuário aos pedaços da conversa"""
+    content = msg.get("message", {}).get("content", "")
+    if content:
+        if parts:
+            parts.append("\n\n")
+        parts.append("👤 Usuário: ")
+        parts.append(content if type(content) is str else str(content))
+
+def _append_assistant_message(msg: Dict, parts: List[str]):
+    """Acrescenta os blocos de texto de uma resposta do Claude aos pedaços da conversa"""
+    content = msg.get("message", {}).get("content", [])
+    
+    content_type = type(content)
+    if content_type is list:
+        text_parts = []
+        for block in content:
+            # Blocos não-dict (ou sem "type") são ignorados
+            try:
+                if block["type"] == "text":
+                    text_parts.append(block.get("text", ""))
+            except (TypeError, KeyError):
+                pass
+    elif content_type is str:
+        text_parts = [content]
+    else:
+        return
+    
+    # Equivale a "\n".join(text_parts).strip() sem montar a string intermediária
+    has_text = False
+    for text in text_parts:
+        if text.strip():
+            has_text = True
+    
+    if has_text:
+        if parts:
+            parts.append("\n\n")
+        parts.append("🤖 Claude: ")
+        parts.append(text_parts[0])
+        for text in text_parts[1:]:
+            parts.append("\n")
+            parts.append(text)
+
+# Tratamento por tipo de mensagem em _extract_conversation (demais tipos são ignorados)
+_CONVERSATION_HANDLERS = {
+    "user": _append_user_message,
+    "assistant": _append_assistant_message,
+}
+
 class SessionSummarizer:
     """Gerenciador de resumos de sessões Claude"""
     
     def __init__(self):
         self.claude_viewer = get_claude_viewer()
-        self.cache = {}  # Cache simples em memória
+        self.cache = OrderedDict()  # Cache LRU em memória
+        self.cache_max = SUMMARY_CACHE_MAX
+        # Gerações em andamento por chave de cache (coalescência de requisições iguais)
+        self.inflight: Dict[str, asyncio.Future] = {}
+        # O servidor atende requisições em threads: protege cache e inflight
+        self._cache_lock = threading.Lock()
+        self.prune_conversation_cache()
     
     def _get_cache_key(self, directory: str, session_id: str, summary_type: str) -> str:
-        """Gera chave única para cache de resumo"""
-        content = f"{directory}:{session_id}:{summary_type}"
-        return hashlib.md5(content.encode()).hexdigest()
+        """Gera chave única para cache de resumo (BLAKE2b de 64 bits)
+        
+        Inclui mtime/tamanho do .jsonl, então editar a sessão invalida o resumo em cache.
+        """
+        try:
+            st = os.stat(CLAUDE_PROJECTS_PATH / directory / f"{session_id}.jsonl")
+            version = b'%d:%d' % (st.st_mtime_ns, st.st_size)
+        except OSError:
+            version = b'-'
+        content = b'%b:%b:%b:%b' % (directory.encode(), session_id.encode(), summary_type.encode(), version)
+        return hashlib.blake2b(content, digest_size=8).hexdigest()
     
     def _load_session_file(self, directory: str, session_id: str) -> Optional[Dict]:
         """Carrega arquivo .jsonl da sessão"""
         try:
             file_path = CLAUDE_PROJECTS_PATH / directory / f"{session_id}.jsonl"
             
-            if not file_path.exists():
+            # stat primeiro: mtime/size identificam leituras que podem ser coalescidas
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
                 logger.error(f"Arquivo de sessão não encontrado: {file_path}")
                 return None
             
-            messages = []
-            with open(file_path, 'r', encoding='utf-8') as file:
-                for line_num, line in enumerate(file, 1):
-                    line = line.strip()
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            messages.append(data)
-                        except json.JSONDecodeError as e:
-                            logger.warning(f"Erro linha {line_num} em {file_path}: {e}")
-                            continue
+            messages = _session_reader.read(str(file_path), st.st_mtime_ns, st.st_size)
             
             logger.info(f"Sessão carregada: {len(messages)} mensagens de {file_path}")
             return {
@@ -63,55 +193,189 @@ class SessionSummarizer:
             logger.error(f"Erro ao carregar sessão {directory}/{session_id}: {e}")
             return None
     
-    def _extract_conversation(self, messages: List[Dict]) -> str:
-        """Extrai texto limpo da conversa para resumo"""
-        conversation_parts = []
+    def _get_conversation_cache_path(self, directory: str, session_id: str) -> Path:
+        """Path do texto da conversa já extraído (em CONVERSATION_CACHE_PATH)"""
+        return CONVERSATION_CACHE_PATH / directory / f"{session_id}.conv.txt"
+    
+    def delete_conversation_cache(self, directory: str, session_id: str):
+        """Remove o texto em cache de uma sessão (chamado ao excluir a sessão)"""
+        try:
+            os.unlink(self._get_conversation_cache_path(directory, session_id))
+        except FileNotFoundError:
+            pass
+    
+    def prune_conversation_cache(self) -> int:
+        """
+        Remove textos em cache cujo .jsonl não existe mais e temporários órfãos
+        
+        Sessões apagadas fora do viewer (ex.: limpeza do próprio CLI) não passam
+        por delete_conversation_cache; chamado na inicialização para não deixar
+        cópias da conversa para trás.
+        """
+        removed = 0
+        try:
+            directories = list(os.scandir(CONVERSATION_CACHE_PATH))
+        except FileNotFoundError:
+            return 0
+        for directory in directories:
+            if not directory.is_dir():
+                continue
+            with os.scandir(directory.path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".conv.txt"):
+                        session_id = entry.name[:-len(".conv.txt")]
+                        if (CLAUDE_PROJECTS_PATH / directory.name / f"{session_id}.jsonl").exists():
+                            continue
+                    elif not entry.name.endswith(".tmp"):
+                        continue
+                    try:
+                        os.unlink(entry.path)
+                        removed += 1
+                    except OSError:
+                        pass
+        if removed:
+            logger.info(f"Cache de conversas: {removed} arquivos órfãos removidos")
+        return removed
+    
+    def _read_conversation_cache(self, cache_path: Path, st: os.stat_result) -> Optional[Tuple[str, Dict]]:
+        """Lê o texto/metadados em cache se corresponderem à versão atual do .jsonl"""
+        try:
+            with open(cache_path, 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return None
+        
+        header, _, body = raw.partition(b"\n")
+        version, _, header_json = header.partition(b" ")
+        if version != CONVERSATION_CACHE_VERSION:
+            return None
+        try:
+            info = json_utils.loads(header_json)
+            if info.get("mtime_ns") != st.st_mtime_ns or info.get("size") != st.st_size:
+                return None
+            # Corpo truncado ou corrompido: tratar como ausente
+            if info.get("body_size") != len(body) or info.get("body_hash") != self._hash_body(body):
+                logger.warning(f"Cache da conversa inválido, ignorando: {cache_path}")
+                return None
+            return body.decode('utf-8'), info.get("metadata", {})
+        except (ValueError, AttributeError):
+            # JSONDecodeError/UnicodeDecodeError são ValueError; cabeçalho que não é objeto
+            return None
+    
+    @staticmethod
+    def _hash_body(body: bytes) -> str:
+        return hashlib.blake2b(body, digest_size=16).hexdigest()
+    
+    def _write_conversation_cache(self, cache_path: Path, st: os.stat_result, text: str, metadata: Dict):
+        """
+        Grava o texto extraído de forma atômica (falhas apenas são registradas)
+        
+        Cada escrita usa um arquivo temporário próprio: resumos simultâneos da
+        mesma sessão não se misturam antes do os.replace. O arquivo fica em
+        CONVERSATION_CACHE_PATH, não ao lado do .jsonl: o mkstemp/os.replace
+        mudaria o mtime do diretório da sessão e invalidaria a lista de
+        sessões em cache do viewer.
+        """
+        body = text.encode('utf-8')
+        header = json_utils.dumps({
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "body_size": len(body),
+            "body_hash": self._hash_body(body),
+            "metadata": metadata
+        })
+        tmp_path = None
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, prefix=f".{cache_path.name}.", suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                f.write(CONVERSATION_CACHE_VERSION + b" " + header + b"\n" + body)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar cache da conversa {cache_path}: {e}")
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+    
+    def _load_conversation(self, directory: str, session_id: str) -> Optional[Tuple[str, Dict]]:
+        """
+        Retorna (texto da conversa, metadados) de uma sessão
+        
+        Usa o .conv.txt da sessão quando ele corresponde ao mtime/tamanho atual do
+        .jsonl; caso contrário faz load + extração e regrava o cache.
+        """
+        file_path = CLAUDE_PROJECTS_PATH / directory / f"{session_id}.jsonl"
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            logger.error(f"Arquivo de sessão não encontrado: {file_path}")
+            return None
+        
+        cache_path = self._get_conversation_cache_path(directory, session_id)
+        cached = self._read_conversation_cache(cache_path, st)
+        if cached is not None:
+            logger.info(f"Conversa lida do cache em disco: {cache_path}")
+            return cached
+        
+        session_data = self._load_session_file(directory, session_id)
+        if not session_data:
+            return None
+        
+        conversation_text, type_counts = self._extract_conversation(session_data["messages"])
+        metadata = self._get_session_metadata(session_data, type_counts)
+        self._write_conversation_cache(cache_path, st, conversation_text, metadata)
+        return conversation_text, metadata
+    
+    def _extract_conversation(self, messages: List[Dict]) -> Tuple[str, Dict[str, int]]:
+        """
+        Extrai texto limpo da conversa para resumo
+        
+        Returns:
+            (texto da conversa, contagem de mensagens por tipo "user"/"assistant"),
+            a contagem é reaproveitada por _get_session_metadata
+        """
+        # Lista plana de pedaços unida uma única vez no final
+        parts = []
+        handlers = _CONVERSATION_HANDLERS
+        type_counts = dict.fromkeys(handlers, 0)
         
         for msg in messages:
             try:
                 msg_type = msg.get("type", "")
-                timestamp = msg.get("timestamp", "")
-                
-                if msg_type == "user":
-                    # Mensagem do usuário
-                    message_data = msg.get("message", {})
-                    content = message_data.get("content", "")
-                    
-                    if content:
-                        conversation_parts.append(f"👤 Usuário: {content}")
-                
-                elif msg_type == "assistant":
-                    # Resposta do Claude
-                    message_data = msg.get("message", {})
-                    content = message_data.get("content", [])
-                    
-                    text_parts = []
-                    if isinstance(content, list):
-                        for block in content:
-                            if isinstance(block, dict) and block.get("type") == "text":
-                                text_parts.append(block.get("text", ""))
-                    elif isinstance(content, str):
-                        text_parts.append(content)
-                    
-                    full_text = "\n".join(text_parts)
-                    if full_text.strip():
-                        conversation_parts.append(f"🤖 Claude: {full_text}")
-                
+                handler = handlers.get(msg_type)
+                if handler is not None:
+                    type_counts[msg_type] += 1
+                    handler(msg, parts)
             except Exception as e:
                 logger.warning(f"Erro ao processar mensagem: {e}")
                 continue
         
-        conversation_text = "\n\n".join(conversation_parts)
+        conversation_text = "".join(parts)
         logger.info(f"Conversa extraída: {len(conversation_text)} caracteres")
-        return conversation_text
+        return conversation_text, type_counts
     
-    def _get_session_metadata(self, session_data: Dict) -> Dict:
-        """Extrai metadados da sessão para incluir no resumo"""
+    def _get_session_metadata(self, session_data: Dict,
+                              type_counts: Optional[Dict[str, int]] = None) -> Dict:
+        """Extrai metadados da sessão para incluir no resumo
+        
+        type_counts: contagem já feita por _extract_conversation (evita nova passada)
+        """
         messages = session_data.get("messages", [])
         
-        # Contadores
-        user_messages = sum(1 for msg in messages if msg.get("type") == "user")
-        assistant_messages = sum(1 for msg in messages if msg.get("type") == "assistant")
+        if type_counts is not None:
+            user_messages = type_counts["user"]
+            assistant_messages = type_counts["assistant"]
+        else:
+            # Contadores (uma única passada pela lista)
+            user_messages = assistant_messages = 0
+            for msg in messages:
+                msg_type = msg.get("type")
+                if msg_type == "user":
+                    user_messages += 1
+                elif msg_type == "assistant":
+                    assistant_messages += 1
         
         # Timestamps
         first_msg = messages[0] if messages else {}
@@ -124,8 +388,8 @@ class SessionSummarizer:
         duration = "N/A"
         if first_time and last_time:
             try:
-                first_dt = datetime.fromisoformat(first_time.replace('Z', '+00:00'))
-                last_dt = datetime.fromisoformat(last_time.replace('Z', '+00:00'))
+                first_dt = _parse_timestamp(first_time)
+                last_dt = _parse_timestamp(last_time)
                 duration_delta = last_dt - first_dt
                 duration = str(duration_delta).split('.')[0]  # Remove microseconds
             except:
@@ -161,56 +425,43 @@ class SessionSummarizer:
         try:
             # Verifica cache primeiro
             cache_key = self._get_cache_key(directory, session_id, summary_type)
-            if cache_key in self.cache:
-                logger.info(f"Resumo encontrado em cache: {cache_key}")
-                return self.cache[cache_key]
-            
-            # Carrega dados da sessão
-            session_data = self._load_session_file(directory, session_id)
-            if not session_data:
-                return {
-                    "success": False,
-                    "error": f"Não foi possível carregar sessão {directory}/{session_id}",
-                    "summary": ""
-                }
-            
-            # Extrai conversa para resumo
-            conversation_text = self._extract_conversation(session_data["messages"])
-            if not conversation_text.strip():
-                return {
-                    "success": False,
-                    "error": "Conversa vazia ou não processável",
-                    "summary": ""
-                }
-            
-            # Gera resumo usando Claude
-            summary_result = await self.claude_viewer.generate_summary(
-                conversation_text, 
-                summary_type
-            )
-            
-            if not summary_result.get("success"):
-                return summary_result
+            loop = asyncio.get_running_loop()
+            with self._cache_lock:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    self.cache.move_to_end(cache_key)
+                inflight = self.inflight.get(cache_key)
+                if cached is None and (inflight is None or inflight.get_loop() is not loop):
+                    fut = loop.create_future()
+                    self.inflight[cache_key] = fut
+                    inflight = None
             
-            # Adiciona metadados da sessão
-            metadata = self._get_session_metadata(session_data)
-            
-            # Monta resultado completo
-            final_result = {
-                "success": True,
-                "summary": summary_result["summary"],
-                "type": summary_type,
-                "session_metadata": metadata,
-                "metrics": summary_result.get("metrics", {}),
-                "generated_at": datetime.now().isoformat(),
-                "conversation_length": len(conversation_text)
-            }
+            # Cada chamador recebe uma cópia rasa: o dict guardado no cache/future é
+            # compartilhado entre threads e o handler acrescenta campos (summary_id)
+            if cached is not None:
+                logger.info(f"Resumo encontrado em cache: {cache_key}")
+                return dict(cached)
             
-            # Salva no cache
-            self.cache[cache_key] = final_result
+            # Outra requisição igual já em andamento no mesmo loop: aguarda o mesmo resultado
+            if inflight is not None:
+                logger.info(f"Resumo já em geração, aguardando: {cache_key}")
+                return dict(await asyncio.shield(inflight))
             
-            logger.info(f"Resumo gerado com sucesso para {directory}/{session_id}")
-            return final_result
+            try:
+                result = await self._build_summary(directory, session_id, summary_type, cache_key)
+                fut.set_result(result)
+                return dict(result)
+            except asyncio.CancelledError:
+                fut.cancel()
+                raise
+            except Exception as e:
+                fut.set_exception(e)
+                fut.exception()  # marca como consumida caso ninguém esteja aguardando
+                raise
+            finally:
+                with self._cache_lock:
+                    if self.inflight.get(cache_key) is fut:
+                        del self.inflight[cache_key]
             
         except Exception as e:
             logger.error(f"Erro ao gerar resumo: {e}")
@@ -220,16 +471,70 @@ class SessionSummarizer:
                 "summary": ""
             }
     
+    async def _build_summary(self, directory: str, session_id: str,
+                             summary_type: str, cache_key: str) -> Dict[str, Any]:
+        """Carrega a sessão, gera o resumo via Claude e grava no cache"""
+        # Carrega e extrai a conversa (ou lê do cache em disco) em uma thread
+        # para não bloquear o event loop
+        loaded = await asyncio.to_thread(self._load_conversation, directory, session_id)
+        if loaded is None:
+            return {
+                "success": False,
+                "error": f"Não foi possível carregar sessão {directory}/{session_id}",
+                "summary": ""
+            }
+        
+        conversation_text, metadata = loaded
+        if not conversation_text.strip():
+            return {
+                "success": False,
+                "error": "Conversa vazia ou não processável",
+                "summary": ""
+            }
+        
+        # Gera resumo usando Claude
+        summary_result = await self.claude_viewer.generate_summary(
+            conversation_text, 
+            summary_type
+        )
+        
+        if not summary_result.get("success"):
+            return summary_result
+        
+        # Monta resultado completo
+        final_result = {
+            "success": True,
+            "summary": summary_result["summary"],
+            "type": summary_type,
+            "session_metadata": metadata,
+            "metrics": summary_result.get("metrics", {}),
+            "generated_at": datetime.now().isoformat(),
+            "conversation_length": len(conversation_text)
+        }
+        
+        # Salva no cache
+        with self._cache_lock:
+            self.cache[cache_key] = final_result
+            if len(self.cache) > self.cache_max:
+                self.cache.popitem(last=False)
+        
+        logger.info(f"Resumo gerado com sucesso para {directory}/{session_id}")
+        return final_result
+    
     def clear_cache(self):
         """Limpa cache de resumos"""
-        self.cache = {}
+        with self._cache_lock:
+            self.cache.clear()
         logger.info("Cache de resumos limpo")
     
     def get_cache_stats(self) -> Dict:
         """Retorna estatísticas do cache"""
+        with self._cache_lock:
+            cache_keys = list(self.cache.keys())
         return {
-            "cached_summaries": len(self.cache),
-            "cache_keys": list(self.cache.keys())
+            "cached_summaries": len(cache_keys),
+            "max_cached_summaries": self.cache_max,
+            "cache_keys": cache_keys
         }
 
     def test_summarizer(self) -> Dict[str, Any]:
@@ -242,12 +547,7 @@ class SessionSummarizer:
             projects_accessible = CLAUDE_PROJECTS_PATH.exists()
             
             # Lista sessões disponíveis para teste
-            available_sessions = 0
-            if projects_accessible:
-                for directory in CLAUDE_PROJECTS_PATH.iterdir():
-                    if directory.is_dir():
-                        jsonl_files = list(directory.glob("*.jsonl"))
-                        available_sessions += len(jsonl_files)
+            available_sessions = json_utils.count_sessions(CLAUDE_PROJECTS_PATH) if projects_accessible else 0
             
             return {
                 "success": True,
@@ -4,18 +4,28 @@ Sistema de Armazenamento de Resumos
 Gerencia CRUD de resumos gerados por sessão
 """
 
-import json
+import os
+import sqlite3
+import threading
 import hashlib
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 import logging
 
+from json_utils import loads, dumps, JSONDecodeError
+
 logger = logging.getLogger(__name__)
 
 # Path para armazenar resumos
 SUMMARIES_PATH = Path("/home/suthub/.claude/summaries")
 
+# Número máximo de resumos mantidos por sessão
+MAX_SUMMARIES_PER_SESSION = 20
+
+# Linhas acumuladas no JSONL antes de reescrever o arquivo com os últimos resumos
+COMPACT_THRESHOLD = 40
+
 class SummaryStorage:
     """Gerenciador de armazenamento de resumos"""
     
@@ -23,14 +33,192 @@ class SummaryStorage:
         # Garantir que diretório existe
         SUMMARIES_PATH.mkdir(parents=True, exist_ok=True)
         
+        # Índice SQLite derivado dos arquivos JSONL (os arquivos continuam sendo a fonte de verdade)
+        self._db_lock = threading.Lock()
+        # Serializa append/compactação/remoção nos arquivos JSONL
+        self._file_lock = threading.Lock()
+        # Incrementada a cada alteração do índice; permite cachear respostas derivadas dele
+        self._version = 0
+        # Linhas atuais de cada arquivo JSONL (decide a compactação sem reler o arquivo a cada save)
+        self._line_counts: Dict[Path, int] = {}
+        self._db = sqlite3.connect(str(SUMMARIES_PATH / "index.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                id TEXT PRIMARY KEY,
+                directory TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                blob BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_summaries_session ON summaries (directory, session_id);
+            CREATE INDEX IF NOT EXISTS idx_summaries_timestamp ON summaries (timestamp DESC);
+        """)
+        self.refresh()
+    
+    def _scan_summary_files(self) -> List[Path]:
+        """Lista os arquivos de resumo (SUMMARIES_PATH/<directory>/<sessão>_summaries.*) com os.scandir"""
+        summary_files = []
+        with os.scandir(SUMMARIES_PATH) as directories:
+            for directory in directories:
+                if not directory.is_dir():
+                    continue
+                with os.scandir(directory.path) as entries:
+                    for entry in entries:
+                        if entry.name.endswith(("_summaries.jsonl", "_summaries.json")):
+                            summary_files.append(Path(entry.path))
+        return summary_files
+    
+    def refresh(self):
+        """
+        Reconstrói o índice a partir dos arquivos
+        
+        Chamado na inicialização (recupera o índice após falhas ou edições
+        externas); fora isso o índice é mantido por save/delete.
+        """
+        with self._file_lock:
+            self._line_counts.clear()
+            jsonl_files = set()
+            for summary_file in self._scan_summary_files():
+                if summary_file.suffix == ".json":
+                    # Converter arquivos no formato antigo (lista JSON) antes de indexar
+                    try:
+                        self._migrate_legacy_file(summary_file)
+                    except (OSError, TypeError, ValueError, KeyError) as e:
+                        logger.warning(f"Falha ao migrar {summary_file}: {str(e)}")
+                    summary_file = summary_file.with_suffix(".jsonl")
+                jsonl_files.add(summary_file)
+            
+            rows = []
+            for summary_file in jsonl_files:
+                try:
+                    summaries = self._read_summary_file(summary_file)
+                    rows.extend(self._index_row(summary) for summary in summaries[-MAX_SUMMARIES_PER_SESSION:])
+                except (TypeError, ValueError, KeyError) as e:
+                    # Um arquivo inconsistente não deve impedir a inicialização
+                    logger.warning(f"Arquivo de resumos ignorado na indexação {summary_file}: {str(e)}")
+                    continue
+                self._line_counts[summary_file] = len(summaries)
+        
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM summaries")
+            self._db.executemany("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)", rows)
+            self._version += 1
+        logger.info(f"Índice de resumos reconstruído: {len(rows)} resumos")
+    
+    @staticmethod
+    def _index_row(summary: Dict[str, Any]) -> tuple:
+        """Converte um resumo em linha da tabela de índice"""
+        return (
+            summary.get('id', ''),
+            summary.get('directory', ''),
+            summary.get('session_id', ''),
+            summary.get('timestamp', ''),
+            dumps(summary)
+        )
+    
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Executa uma consulta no índice de forma segura entre threads"""
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+        
     def _get_session_summary_path(self, directory: str, session_id: str) -> Path:
         """Gera path para arquivos de resumo de uma sessão específica"""
-        return SUMMARIES_PATH / directory / f"{session_id}_summaries.json"
+        return SUMMARIES_PATH / directory / f"{session_id}_summaries.jsonl"
+    
+    def _read_summary_file(self, summary_file: Path) -> List[Dict[str, Any]]:
+        """Lê um arquivo JSONL de resumos (uma linha por resumo, linhas inválidas são ignoradas)"""
+        try:
+            with open(summary_file, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return []
+        
+        summaries = []
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                summary = loads(line)
+            except JSONDecodeError:
+                # Linha parcial (ex.: escrita interrompida)
+                logger.warning(f"Linha inválida ignorada em {summary_file}")
+                continue
+            if isinstance(summary, dict):
+                summaries.append(summary)
+            else:
+                logger.warning(f"Linha que não é um resumo ignorada em {summary_file}")
+        return summaries
+    
+    def _write_summary_file(self, summary_file: Path, summaries: List[Dict[str, Any]]):
+        """Reescreve o arquivo JSONL de forma atômica"""
+        tmp_file = summary_file.with_name(summary_file.name + ".tmp")
+        with open(tmp_file, 'wb') as f:
+            f.write(b"".join(dumps(summary) + b"\n" for summary in summaries))
+        os.replace(tmp_file, summary_file)
+        self._line_counts[summary_file] = len(summaries)
+    
+    def _migrate_legacy_file(self, legacy_file: Path):
+        """Converte um arquivo antigo <sessão>_summaries.json para JSONL"""
+        try:
+            with open(legacy_file, 'rb') as f:
+                legacy_summaries = loads(f.read())
+        except OSError as e:
+            logger.warning(f"Não foi possível migrar {legacy_file}: {str(e)}")
+            return
+        except (JSONDecodeError, TypeError, ValueError, KeyError) as e:
+            self._quarantine_legacy_file(legacy_file, str(e))
+            return
+        
+        if not isinstance(legacy_summaries, list):
+            self._quarantine_legacy_file(legacy_file, "conteúdo não é uma lista de resumos")
+            return
+        
+        summary_file = legacy_file.with_name(legacy_file.stem + ".jsonl")
+        legacy_summaries = [s for s in legacy_summaries if isinstance(s, dict)]
+        # Resumos já gravados em JSONL são mais recentes que os do arquivo antigo
+        self._write_summary_file(summary_file, legacy_summaries + self._read_summary_file(summary_file))
+        legacy_file.unlink()
+        logger.info(f"Arquivo de resumos migrado para JSONL: {summary_file}")
+    
+    def _quarantine_legacy_file(self, legacy_file: Path, reason: str):
+        """Renomeia um arquivo antigo inválido para .invalid (fica fora das próximas varreduras)"""
+        logger.warning(f"Arquivo de resumos inválido {legacy_file} movido para quarentena: {reason}")
+        try:
+            os.replace(legacy_file, legacy_file.with_name(legacy_file.name + ".invalid"))
+        except OSError as e:
+            logger.warning(f"Não foi possível mover {legacy_file} para quarentena: {str(e)}")
+    
+    def _migrate_if_legacy(self, summary_file: Path):
+        """Migra o arquivo antigo da sessão, se ainda existir"""
+        legacy_file = summary_file.with_suffix(".json")
+        if legacy_file.exists():
+            self._migrate_legacy_file(legacy_file)
+    
+    def _maybe_compact(self, summary_file: Path):
+        """
+        Reescreve o arquivo com os últimos resumos só quando passa de COMPACT_THRESHOLD linhas
+        
+        Chamado após cada append; usa o contador de linhas em memória e só
+        lê o arquivo na primeira vez que ele aparece (ex.: criado após o refresh).
+        """
+        line_count = self._line_counts.get(summary_file)
+        if line_count is None:
+            with open(summary_file, 'rb') as f:
+                line_count = sum(1 for _ in f)
+        else:
+            line_count += 1
+        self._line_counts[summary_file] = line_count
+        
+        if line_count > COMPACT_THRESHOLD:
+            summaries = self._read_summary_file(summary_file)
+            self._write_summary_file(summary_file, summaries[-MAX_SUMMARIES_PER_SESSION:])
     
     def _generate_summary_id(self, session_id: str, summary_type: str, timestamp: str, custom_prompt: str = "") -> str:
-        """Gera ID único para um resumo"""
+        """Gera ID único para um resumo (BLAKE2b de 64 bits, 16 caracteres hex)"""
         content = f"{session_id}:{summary_type}:{timestamp}:{custom_prompt}"
-        return hashlib.md5(content.encode()).hexdigest()[:12]
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
     
     def save_summary(self, directory: str, session_id: str, summary_data: Dict[str, Any]) -> str:
         """
@@ -44,15 +232,6 @@ class SummaryStorage:
             summary_file = self._get_session_summary_path(directory, session_id)
             summary_file.parent.mkdir(parents=True, exist_ok=True)
             
-            # Carregar resumos existentes
-            existing_summaries = []
-            if summary_file.exists():
-                try:
-                    with open(summary_file, 'r', encoding='utf-8') as f:
-                        existing_summaries = json.load(f)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    existing_summaries = []
-            
             # Criar registro do novo resumo
             timestamp = datetime.now().isoformat()
             summary_id = self._generate_summary_id(
@@ -76,15 +255,30 @@ class SummaryStorage:
                 "generated_at": summary_data.get('generated_at', timestamp)
             }
             
-            # Adicionar à lista
-            existing_summaries.append(new_summary)
+            with self._file_lock:
+                self._migrate_if_legacy(summary_file)
+                
+                # Acrescentar uma linha; o limite de 20 por sessão é aplicado na compactação
+                with open(summary_file, 'ab') as f:
+                    f.write(dumps(new_summary) + b"\n")
+                self._maybe_compact(summary_file)
             
-            # Manter apenas os últimos 20 resumos por sessão
-            existing_summaries = existing_summaries[-20:]
-            
-            # Salvar arquivo
-            with open(summary_file, 'w', encoding='utf-8') as f:
-                json.dump(existing_summaries, f, indent=2, ensure_ascii=False)
+            # Atualizar índice e aplicar o mesmo limite por sessão
+            with self._db_lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                    self._index_row(new_summary)
+                )
+                self._db.execute(
+                    """DELETE FROM summaries
+                       WHERE directory = ? AND session_id = ? AND id NOT IN (
+                           SELECT id FROM summaries
+                           WHERE directory = ? AND session_id = ?
+                           ORDER BY timestamp DESC LIMIT ?
+                       )""",
+                    (directory, session_id, directory, session_id, MAX_SUMMARIES_PER_SESSION)
+                )
+                self._version += 1
             
             logger.info(f"Resumo salvo: {summary_id} para {directory}/{session_id}")
             return summary_id
@@ -96,18 +290,12 @@ class SummaryStorage:
     def get_summaries_for_session(self, directory: str, session_id: str) -> List[Dict[str, Any]]:
         """Retorna todos os resumos de uma sessão específica"""
         try:
-            summary_file = self._get_session_summary_path(directory, session_id)
-            
-            if not summary_file.exists():
-                return []
-            
-            with open(summary_file, 'r', encoding='utf-8') as f:
-                summaries = json.load(f)
-            
-            # Ordenar por timestamp (mais recente primeiro)
-            summaries.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-            
-            return summaries
+            # Ordenados por timestamp (mais recente primeiro)
+            rows = self._query(
+                "SELECT blob FROM summaries WHERE directory = ? AND session_id = ? ORDER BY timestamp DESC",
+                (directory, session_id)
+            )
+            return [loads(blob) for (blob,) in rows]
             
         except Exception as e:
             logger.error(f"Erro ao carregar resumos para {directory}/{session_id}: {str(e)}")
@@ -116,18 +304,9 @@ class SummaryStorage:
     def get_summary_by_id(self, summary_id: str) -> Optional[Dict[str, Any]]:
         """Retorna um resumo específico pelo ID"""
         try:
-            # Buscar em todos os arquivos (pode ser otimizado com índice)
-            for summary_file in SUMMARIES_PATH.rglob("*_summaries.json"):
-                try:
-                    with open(summary_file, 'r', encoding='utf-8') as f:
-                        summaries = json.load(f)
-                    
-                    for summary in summaries:
-                        if summary.get('id') == summary_id:
-                            return summary
-                            
-                except (json.JSONDecodeError, FileNotFoundError):
-                    continue
+            rows = self._query("SELECT blob FROM summaries WHERE id = ?", (summary_id,))
+            if rows:
+                return loads(rows[0][0])
             
             return None
             
@@ -140,21 +319,27 @@ class SummaryStorage:
         try:
             summary_file = self._get_session_summary_path(directory, session_id)
             
-            if not summary_file.exists():
-                return False
-            
-            with open(summary_file, 'r', encoding='utf-8') as f:
-                summaries = json.load(f)
-            
-            # Filtrar resumo a ser removido
-            updated_summaries = [s for s in summaries if s.get('id') != summary_id]
+            with self._file_lock:
+                self._migrate_if_legacy(summary_file)
+                
+                if not summary_file.exists():
+                    return False
+                
+                # Apenas os resumos ainda vigentes (linhas antigas aguardando compactação são descartadas)
+                summaries = self._read_summary_file(summary_file)[-MAX_SUMMARIES_PER_SESSION:]
+                
+                # Filtrar resumo a ser removido
+                updated_summaries = [s for s in summaries if s.get('id') != summary_id]
+                
+                if len(updated_summaries) == len(summaries):
+                    return False  # ID não encontrado
+                
+                # Salvar arquivo atualizado
+                self._write_summary_file(summary_file, updated_summaries)
             
-            if len(updated_summaries) == len(summaries):
-                return False  # ID não encontrado
-            
-            # Salvar arquivo atualizado
-            with open(summary_file, 'w', encoding='utf-8') as f:
-                json.dump(updated_summaries, f, indent=2, ensure_ascii=False)
+            with self._db_lock, self._db:
+                self._db.execute("DELETE FROM summaries WHERE id = ?", (summary_id,))
+                self._version += 1
             
             logger.info(f"Resumo {summary_id} removido de {directory}/{session_id}")
             return True
@@ -166,40 +351,24 @@ class SummaryStorage:
     def get_all_summaries(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Retorna todos os resumos do sistema ordenados por timestamp"""
         try:
-            all_summaries = []
-            
-            # Buscar em todos os arquivos
-            for summary_file in SUMMARIES_PATH.rglob("*_summaries.json"):
-                try:
-                    with open(summary_file, 'r', encoding='utf-8') as f:
-                        summaries = json.load(f)
-                        all_summaries.extend(summaries)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    continue
-            
-            # Ordenar por timestamp (mais recente primeiro)
-            all_summaries.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-            
-            return all_summaries[:limit]
+            # Ordenados por timestamp (mais recente primeiro)
+            rows = self._query("SELECT blob FROM summaries ORDER BY timestamp DESC LIMIT ?", (limit,))
+            return [loads(blob) for (blob,) in rows]
             
         except Exception as e:
             logger.error(f"Erro ao carregar todos os resumos: {str(e)}")
             return []
     
+    def get_version(self) -> int:
+        """Versão atual do índice: muda sempre que um resumo é salvo ou removido"""
+        return self._version
+    
     def get_storage_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas do armazenamento"""
         try:
-            total_summaries = 0
-            total_sessions = 0
-            
-            for summary_file in SUMMARIES_PATH.rglob("*_summaries.json"):
-                try:
-                    with open(summary_file, 'r', encoding='utf-8') as f:
-                        summaries = json.load(f)
-                        total_summaries += len(summaries)
-                        total_sessions += 1
-                except:
-                    continue
+            total_summaries, total_sessions = self._query(
+                "SELECT COUNT(*), COUNT(DISTINCT directory || '/' || session_id) FROM summaries"
+            )[0]
             
             return {
                 "total_summaries": total_summaries,
@@ -4,78 +4,328 @@ Viewer simples para sessões do Claude Code
 Servidor HTTP básico para visualizar arquivos .jsonl
 """
 
-import json
 import os
+import re
+import hashlib
 import asyncio
+import gzip
 from pathlib import Path
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from functools import lru_cache
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
 import threading
-import webbrowser
 import time
 
+import json_utils
+
+# Brotli (opcional) para a página principal
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # Imports para funcionalidade de resumo
 from session_summarizer import get_session_summarizer
 from summary_storage import get_summary_storage
 
 CLAUDE_PROJECTS_PATH = Path("/home/suthub/.claude/projects")
 
-class ViewerHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        
-        if path == "/":
-            self.serve_index()
-        elif path == "/api/sessions":
-            self.serve_sessions_list()
-        elif path == "/api/summaries":
-            self.handle_list_summaries_request()
-        elif path.startswith("/api/summaries/"):
-            self.handle_summary_detail_request(path)
-        elif path.startswith("/api/session/"):
-            self.serve_session_detail(path)
-        elif path == "/favicon.ico":
-            self.send_error(404)
-        else:
-            # Verificar se é uma URL de sessão: /{directory}/{session_id}[/resumo]
-            path_parts = path.strip('/').split('/')
-            if len(path_parts) == 2:
-                # URL da sessão específica - servir página principal
-                self.serve_index()
-            elif len(path_parts) == 3 and path_parts[2] == "resumo":
-                # URL de resumo: /{directory}/{session_id}/resumo
-                self.serve_index()
-            else:
-                self.send_error(404)
+# Número máximo de resumos gerados ao mesmo tempo (cada um ocupa o Claude CLI/SDK)
+VIEWER_MAX_SUMMARIES = int(os.environ.get("VIEWER_MAX_SUMMARIES", "4"))
+
+# Log de acesso por requisição (desligado por padrão)
+VIEWER_ACCESS_LOG = os.environ.get("VIEWER_ACCESS_LOG", "0") == "1"
+
+# Tempo (s) que uma conexão keep-alive ociosa fica aberta esperando a próxima requisição;
+# curto: basta para a rajada de fetches da SPA, sem acumular threads ociosas.
+# Vale só para a espera entre requisições (ver ViewerHandler.handle_one_request)
+HTTP_KEEPALIVE_TIMEOUT = 2
+
+# Timeout (s) de cada recv/send depois que uma requisição começou a chegar
+HTTP_REQUEST_TIMEOUT = 30
+
+# Maior corpo não lido pelo handler que ainda é descartado para manter a conexão;
+# acima disso a conexão é fechada
+HTTP_MAX_DISCARDED_BODY = 1024 * 1024
+
+# Tempo máximo (s) que a lista de sessões em cache é reaproveitada: criar/apagar
+# sessões muda o mtime do diretório e invalida na hora, mas escritas dentro de um
+# .jsonl não mudam o mtime do diretório
+SESSIONS_CACHE_TTL = 5
+
+# Nome de diretório/sessão vindo do cliente: só caracteres seguros, até 128,
+# sem "." / ".." (path traversal); inválidos são recusados antes de qualquer syscall
+_SAFE_NAME = r'(?!\.\.?(?:/|\Z))[A-Za-z0-9_.-]{1,128}'
+_SAFE_NAME_RE = re.compile(_SAFE_NAME)
+
+# /api/session/{directory}/{session_id}
+_SESSION_PATH_RE = re.compile(rf'/api/session/({_SAFE_NAME})/({_SAFE_NAME})')
+
+# Rotas do frontend servidas com a página principal: /{directory}/{session_id}[/resumo]
+_SPA_PATH_RE = re.compile(r'/[^/]+/[^/]+(?:/resumo)?/?')
+
+# Mensagens retornadas pelo endpoint de detalhe de sessão
+SESSION_DETAIL_LIMIT = 50
+
+# Resposta completa do preflight CORS; o navegador pode reutilizá-la por 24h (Max-Age)
+_OPTIONS_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Access-Control-Allow-Methods: GET, POST, DELETE\r\n"
+    b"Access-Control-Allow-Headers: Content-Type\r\n"
+    b"Access-Control-Max-Age: 86400\r\n"
+    b"Content-Length: 0\r\n"
+    b"\r\n"
+)
+
+# Tempo máximo (s) que uma requisição de resumo espera, incluindo a espera por uma
+# vaga em _summarize_slots; deve ficar acima de claude_integration.SUMMARY_TIMEOUT
+# (limite de uma chamada ao SDK), para o erro de timeout do SDK chegar ao cliente
+SUMMARIZE_REQUEST_TIMEOUT = 180
+
+# Cabeçalhos CORS extras das respostas dos endpoints de resumo (POST)
+_SUMMARIZE_CORS_HEADERS = (
+    ('Access-Control-Allow-Methods', 'POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type'),
+)
+
+# JSON de cada sessão por (directory, session_id, mtime)
+_session_fragments = {}
+
+# (chave, instante, payload, etag): substituída por inteiro a cada reconstrução,
+# então a leitura não precisa de lock; o lock só serializa as reconstruções
+_sessions_cache = (None, 0.0, None, None)
+_sessions_cache_lock = threading.Lock()
+
+# (versão do storage, {(directory, session_id, limit): (payload, etag)})
+_summaries_cache = (None, {})
+_SUMMARIES_CACHE_MAX = 64
+
+_async_loop = None
+_async_loop_lock = threading.Lock()
+
+# Limita os resumos simultâneos; as demais conexões continuam com thread própria
+_summarize_slots = threading.BoundedSemaphore(VIEWER_MAX_SUMMARIES)
+
+def _get_async_loop():
+    """Event loop único, rodando em uma thread própria, compartilhado por todas as requisições"""
+    global _async_loop
+    with _async_loop_lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="viewer-async", daemon=True).start()
+            _async_loop = loop
+    return _async_loop
+
+def _run_async(coro, timeout=SUMMARIZE_REQUEST_TIMEOUT):
+    """
+    Executa a corrotina no loop compartilhado e espera o resultado na thread da requisição
     
-    def do_DELETE(self):
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
+    No máximo VIEWER_MAX_SUMMARIES execuções ao mesmo tempo; a espera por uma
+    vaga conta dentro do mesmo timeout.
+    """
+    deadline = time.monotonic() + timeout
+    if not _summarize_slots.acquire(timeout=timeout):
+        coro.close()
+        raise TimeoutError("Limite de resumos simultâneos atingido")
+    try:
+        future = asyncio.run_coroutine_threadsafe(coro, _get_async_loop())
+        try:
+            return future.result(max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+    finally:
+        _summarize_slots.release()
+
+def _scan_project_dir(dir_path, dir_name):
+    """Lista as sessões .jsonl de um diretório de projeto com uma única passada de scandir"""
+    sessions = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.name.endswith(".jsonl") and entry.is_file():
+                sessions.append({
+                    "session_id": entry.name[:-len(".jsonl")],
+                    "directory": dir_name,
+                    "modified_time": entry.stat().st_mtime
+                })
+    return sessions
+
+def _sessions_cache_key():
+    """Chave do cache da listagem: (nome, mtime_ns) de cada diretório de projeto"""
+    if not CLAUDE_PROJECTS_PATH.exists():
+        return ()
+    key = []
+    with os.scandir(CLAUDE_PROJECTS_PATH) as projects:
+        for project in projects:
+            if project.is_dir():
+                key.append((project.name, project.stat().st_mtime_ns))
+    key.sort()
+    return tuple(key)
+
+def _build_sessions_payload():
+    """Varre os projetos e retorna a lista de sessões já serializada em JSON"""
+    sessions = []
+    
+    if CLAUDE_PROJECTS_PATH.exists():
+        with os.scandir(CLAUDE_PROJECTS_PATH) as projects:
+            for project in projects:
+                if project.is_dir():
+                    sessions.extend(_scan_project_dir(project.path, project.name))
+    
+    # Ordenar do mais novo para o mais antigo (mais recentes primeiro, antigas por último)
+    sessions.sort(key=lambda x: x["modified_time"], reverse=True)
+    
+    # Serializar cada sessão; fragmentos de sessões inalteradas são reaproveitados.
+    # modified_time vai como timestamp: o frontend formata no fuso do usuário
+    global _session_fragments
+    previous_fragments = _session_fragments
+    fragments = {}
+    parts = []
+    for session in sessions:
+        key = (session["directory"], session["session_id"], session["modified_time"])
+        fragment = previous_fragments.get(key)
+        if fragment is None:
+            fragment = json_utils.dumps(session)
+        fragments[key] = fragment
+        parts.append(fragment)
+    
+    # Só as sessões ainda existentes ficam no cache
+    _session_fragments = fragments
+    return b"[" + b",".join(parts) + b"]"
+
+def _get_sessions_payload():
+    """
+    Lista de sessões serializada, reaproveitada enquanto os diretórios não mudarem
+    
+    Returns:
+        (payload, etag) - o ETag é derivado do conteúdo, calculado uma vez por reconstrução
+    """
+    global _sessions_cache
+    key = _sessions_cache_key()
+    cached_key, built_at, payload, etag = _sessions_cache
+    if cached_key == key and time.monotonic() - built_at < SESSIONS_CACHE_TTL:
+        return payload, etag
+    
+    with _sessions_cache_lock:
+        # Outra thread pode ter reconstruído enquanto esperávamos o lock
+        cached_key, built_at, payload, etag = _sessions_cache
+        now = time.monotonic()
+        if cached_key == key and now - built_at < SESSIONS_CACHE_TTL:
+            return payload, etag
         
-        if path.startswith("/api/session/"):
-            self.delete_session(path)
-        else:
-            self.send_error(404)
+        payload = _build_sessions_payload()
+        etag = 'W/"%s"' % hashlib.blake2b(payload, digest_size=8).hexdigest()
+        _sessions_cache = (key, now, payload, etag)
+    return payload, etag
+
+def _invalidate_sessions_cache():
+    """
+    Descarta a listagem em cache (após excluir uma sessão)
     
-    def do_POST(self):
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
+    O mtime do diretório também mudaria, mas em sistemas de arquivos com
+    resolução grosseira de mtime a exclusão poderia passar despercebida.
+    """
+    global _sessions_cache
+    with _sessions_cache_lock:
+        _sessions_cache = (None, 0.0, None, None)
+
+def _build_summaries_payload(directory, session_id, limit):
+    """Resposta de /api/summaries serializada em JSON"""
+    storage = get_summary_storage()
+    
+    if directory and session_id:
+        # Resumos específicos de uma sessão
+        summaries = storage.get_summaries_for_session(directory, session_id)
+        print(f"📋 Listando {len(summaries)} resumos para {directory}/{session_id}")
+    else:
+        # Todos os resumos do sistema
+        summaries = storage.get_all_summaries(limit)
+        print(f"📋 Listando {len(summaries)} resumos totais")
+    
+    # Adicionar estatísticas
+    stats = storage.get_storage_stats()
+    
+    return json_utils.dumps({
+        "success": True,
+        "summaries": summaries,
+        "total_found": len(summaries),
+        "storage_stats": stats,
+        "filters_applied": {
+            "directory": directory,
+            "session_id": session_id,
+            "limit": limit
+        }
+    })
+
+def _get_summaries_payload(directory, session_id, limit):
+    """
+    Resposta de /api/summaries por filtros, reaproveitada enquanto a versão do storage não mudar
+    
+    Returns:
+        (payload, etag) - o ETag é derivado do conteúdo (a versão recomeça a cada inicialização)
+    """
+    global _summaries_cache
+    # Versão lida antes dos dados: uma escrita concorrente só pode deixar o cache mais novo que a versão
+    version = get_summary_storage().get_version()
+    cached_version, responses = _summaries_cache
+    if cached_version != version or len(responses) >= _SUMMARIES_CACHE_MAX:
+        responses = {}
+        _summaries_cache = (version, responses)
+    
+    key = (directory, session_id, limit)
+    cached = responses.get(key)
+    if cached is None:
+        payload = _build_summaries_payload(directory, session_id, limit)
+        etag = 'W/"%s"' % hashlib.blake2b(payload, digest_size=8).hexdigest()
+        cached = responses[key] = (payload, etag)
+    return cached
+
+@lru_cache(maxsize=256)
+def _load_session_messages(file_path, mtime_ns, size):
+    """
+    Lê e processa as primeiras SESSION_DETAIL_LIMIT mensagens de um arquivo .jsonl
+    
+    Retorna (mensagens, total): depois do limite as linhas restantes só são
+    contadas, sem parsing. mtime_ns e size fazem parte da chave do cache:
+    qualquer escrita no arquivo gera uma nova entrada e a antiga sai por LRU.
+    """
+    def on_error(line_num, e):
+        print(f"Erro linha {line_num} em {file_path}: {e}")
+    
+    # Método local evita lookup de atributo a cada mensagem
+    messages = []
+    append = messages.append
+    lines = json_utils.iter_jsonl_lines(file_path)
+    
+    for data in json_utils.iter_jsonl_records(lines, on_error):
+        # Processar mensagem em uma única passada
+        get = data.get
+        msg_type = get("type", "")
+        message_data = get("message", {})
+        content = message_data.get("content", get("message", ""))
+        if type(content) is not str:
+            # Blocos (tool_use, tool_result...) já formatados como o JSON.stringify(content, null, 2)
+            # do frontend; feito uma vez por versão do arquivo em vez de a cada visualização
+            content = json_utils.dumps(content, pretty=True).decode('utf-8')
         
-        if path == "/api/summarize":
-            self.handle_summarize_request()
-        elif path == "/api/summarize-custom":
-            self.handle_summarize_custom_request()
-        elif path == "/api/summaries":
-            self.handle_list_summaries_request()
-        elif path.startswith("/api/summaries/"):
-            self.handle_summary_detail_request(path)
-        else:
-            self.send_error(404)
+        append({
+            "uuid": get("uuid", ""),
+            "timestamp": get("timestamp", ""),
+            "type": msg_type,
+            "role": message_data.get("role", msg_type),
+            "content": content
+        })
+        if len(messages) >= SESSION_DETAIL_LIMIT:
+            break
     
-    def serve_index(self):
-        """Serve a página HTML principal"""
-        html = """
+    # Restante do arquivo: apenas contar as linhas não vazias
+    remaining = sum(1 for line in lines if not line.isspace())
+    return messages, len(messages) + remaining
+
+# Página principal (SPA); codificada uma única vez na carga do módulo
+_INDEX_HTML = """
 <!DOCTYPE html>
 <html>
 <head>
@@ -211,6 +461,9 @@ class ViewerHandler(BaseHTTPRequestHandler):
     <div id="content"></div>
     
     <script>
+        // Horário (HH:MM) da última interação, no fuso do navegador
+        const lastInteractionFormat = new Intl.DateTimeFormat([], {hour: '2-digit', minute: '2-digit', hourCycle: 'h23'});
+        
         async function loadSessions() {
             try {
                 const response = await fetch('/api/sessions');
@@ -231,7 +484,7 @@ class ViewerHandler(BaseHTTPRequestHandler):
                                         <div class="session-path">${session.directory}</div>
                                     </div>
                                     <div class="session-footer">
-                                        <div class="last-interaction">${session.last_interaction}</div>
+                                        <div class="last-interaction">${lastInteractionFormat.format(session.modified_time * 1000)}</div>
                                         <div class="session-buttons">
                                             <button class="view-btn" onclick="viewSession('${session.directory}', '${session.session_id}')">
                                                 Ver Sessão
@@ -677,43 +930,183 @@ class ViewerHandler(BaseHTTPRequestHandler):
 </body>
 </html>
         """
+
+def _minify_html(html):
+    """
+    Remove a indentação e as linhas em branco da página
+    
+    Mantém as quebras de linha: o JS embutido tem comentários // e
+    template literals que dependem delas.
+    """
+    return "\n".join(line.strip() for line in html.splitlines() if line and not line.isspace())
+
+_INDEX_HTML_BYTES = _minify_html(_INDEX_HTML).encode('utf-8')
+_INDEX_HTML_DIGEST = hashlib.blake2b(_INDEX_HTML_BYTES, digest_size=8).hexdigest()
+
+def _index_variant(body, encoding):
+    """(corpo, Content-Length, ETag) de uma codificação da página principal"""
+    suffix = "" if encoding == "identity" else "-" + encoding
+    return body, str(len(body)), f'"{_INDEX_HTML_DIGEST}{suffix}"'
+
+# Versões comprimidas uma única vez na carga; ordem = preferência (br > gzip > identity)
+_INDEX_VARIANTS = {}
+if brotli is not None:
+    _INDEX_VARIANTS["br"] = _index_variant(brotli.compress(_INDEX_HTML_BYTES, quality=11), "br")
+_INDEX_VARIANTS["gzip"] = _index_variant(gzip.compress(_INDEX_HTML_BYTES, 9, mtime=0), "gzip")
+_INDEX_VARIANTS["identity"] = _index_variant(_INDEX_HTML_BYTES, "identity")
+
+def _choose_encoding(accept_encoding):
+    """Escolhe a melhor codificação disponível aceita pelo cliente (ignora q=0)"""
+    accepted = set()
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and float(params[2:] or 0) == 0:
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in _INDEX_VARIANTS:
+        if encoding in accepted or encoding == "identity":
+            return encoding
+
+class ViewerHandler(BaseHTTPRequestHandler):
+    # Keep-alive: toda resposta leva Content-Length ou é chunked
+    protocol_version = 'HTTP/1.1'
+    
+    # Timeout de socket durante a requisição; a espera ociosa usa HTTP_KEEPALIVE_TIMEOUT
+    timeout = HTTP_REQUEST_TIMEOUT
+    
+    # TCP_NODELAY: chunks e respostas pequenas saem sem esperar o algoritmo de Nagle
+    disable_nagle_algorithm = True
+    
+    def handle_one_request(self):
+        """
+        Espera a próxima requisição da conexão keep-alive com HTTP_KEEPALIVE_TIMEOUT
+        
+        Conexão ociosa que expira (ou que o cliente fecha) é encerrada em
+        silêncio, sem o "Request timed out" da classe base; depois do primeiro
+        byte vale o timeout normal da requisição.
+        """
+        try:
+            self.connection.settimeout(HTTP_KEEPALIVE_TIMEOUT)
+            pending = self.rfile.peek(1)
+        except (TimeoutError, ConnectionError):
+            pending = b""
+        if not pending:
+            self.close_connection = True
+            return
+        self.connection.settimeout(self.timeout)
+        self._body_read = False
+        super().handle_one_request()
+        self._discard_unread_body()
+    
+    def _discard_unread_body(self):
+        """
+        Consome o corpo que o handler não leu (ex.: POST /api/summaries com JSON)
+        
+        Com keep-alive, bytes do corpo deixados no socket seriam lidos como
+        início da próxima requisição.
+        """
+        if self.close_connection or self._body_read:
+            return
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.close_connection = True
+            return
+        try:
+            content_length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            content_length = -1
+        if content_length == 0:
+            return
+        if not 0 < content_length <= HTTP_MAX_DISCARDED_BODY:
+            self.close_connection = True
+            return
+        try:
+            self.rfile.read(content_length)
+        except (TimeoutError, ConnectionError):
+            self.close_connection = True
+    
+    def log_request(self, code='-', size='-'):
+        """Log de acesso só com VIEWER_ACCESS_LOG=1 (erros de send_error continuam registrados)"""
+        if VIEWER_ACCESS_LOG:
+            super().log_request(code, size)
+    
+    def _dispatch(self, exact_routes, prefix_routes):
+        """
+        Despacha pela tabela de rotas: dict para paths exatos, depois prefixos
+        
+        Guarda a query string em self.query_string para os handlers que a usam.
+        Retorna False se nenhuma rota corresponder.
+        """
+        path, _, self.query_string = self.path.partition('?')
+        
+        handler = exact_routes.get(path)
+        if handler is not None:
+            handler(self)
+            return True
+        for prefix, handler in prefix_routes:
+            if path.startswith(prefix):
+                handler(self, path)
+                return True
+        return False
+    
+    def do_GET(self):
+        if self._dispatch(self._GET_ROUTES, self._GET_PREFIX_ROUTES):
+            return
+        
+        # URL de sessão (/{directory}/{session_id}) ou de resumo (.../resumo): servir página principal
+        if _SPA_PATH_RE.fullmatch(self.path.partition('?')[0]):
+            self.serve_index()
+        else:
+            self.send_error(404)
+    
+    def do_DELETE(self):
+        if not self._dispatch(self._DELETE_ROUTES, self._DELETE_PREFIX_ROUTES):
+            self.send_error(404)
+    
+    def do_POST(self):
+        if not self._dispatch(self._POST_ROUTES, self._POST_PREFIX_ROUTES):
+            self.send_error(404)
+    
+    def send_not_found(self):
+        """404 sem mensagem (ex.: /favicon.ico)"""
+        self.send_error(404)
+    
+    def serve_index(self):
+        """Serve a página HTML principal (pré-comprimida conforme Accept-Encoding)"""
+        try:
+            encoding = _choose_encoding(self.headers.get('Accept-Encoding', ''))
+        except ValueError:
+            encoding = "identity"  # q inválido
+        body, length, etag = _INDEX_VARIANTS[encoding]
+        
+        if self._send_not_modified(etag):
+            return
         
         self.send_response(200)
         self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', length)
+        if encoding != "identity":
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'public, max-age=300')
+        self.send_header('ETag', etag)
         self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+        self.wfile.write(body)
     
     def serve_sessions_list(self):
         """Lista todas as sessões disponíveis"""
         try:
-            sessions = []
-            
-            if CLAUDE_PROJECTS_PATH.exists():
-                for directory in CLAUDE_PROJECTS_PATH.iterdir():
-                    if directory.is_dir():
-                        for jsonl_file in directory.glob("*.jsonl"):
-                            sessions.append({
-                                "session_id": jsonl_file.stem,
-                                "directory": directory.name,
-                                "file_path": str(jsonl_file),
-                                "modified_time": jsonl_file.stat().st_mtime
-                            })
-            
-            # Ordenar do mais novo para o mais antigo (mais recentes primeiro, antigas por último)
-            sessions.sort(key=lambda x: x["modified_time"], reverse=True)
-            
-            # Converter modified_time para horário formatado
-            import datetime
-            for session in sessions:
-                dt = datetime.datetime.fromtimestamp(session["modified_time"])
-                session["last_interaction"] = dt.strftime("%H:%M")
-                del session["modified_time"]
+            payload, etag = _get_sessions_payload()
+            if self._send_not_modified(etag):
+                return
             
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(payload)))
             self.end_headers()
-            self.wfile.write(json.dumps(sessions, ensure_ascii=False).encode('utf-8'))
+            self.wfile.write(payload)
         
         except Exception as e:
             self.send_error(500, f"Erro ao listar sessões: {str(e)}")
@@ -721,105 +1114,140 @@ class ViewerHandler(BaseHTTPRequestHandler):
     def serve_session_detail(self, path):
         """Serve detalhes de uma sessão específica"""
         try:
-            # Extrair directory e session_id da URL
-            parts = path.strip('/').split('/')
-            if len(parts) < 4:  # api/session/directory/session_id
+            # Extrair e validar directory e session_id da URL
+            match = _SESSION_PATH_RE.fullmatch(path)
+            if not match:
                 self.send_error(400, "URL inválida")
                 return
             
-            directory = parts[2]
-            session_id = parts[3]
+            directory, session_id = match.groups()
             
-            file_path = CLAUDE_PROJECTS_PATH / directory / f"{session_id}.jsonl"
+            file_path = os.path.join(CLAUDE_PROJECTS_PATH, directory, f"{session_id}.jsonl")
             
-            if not file_path.exists():
+            # Um único stat serve de checagem de existência e de chave do cache
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
                 self.send_error(404, f"Sessão não encontrada: {directory}/{session_id}")
                 return
             
-            messages = []
-            with open(file_path, 'r', encoding='utf-8') as file:
-                for line_num, line in enumerate(file, 1):
-                    line = line.strip()
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            
-                            # Processar mensagem
-                            message_data = data.get("message", {})
-                            content = message_data.get("content", data.get("message", ""))
-                            
-                            processed_msg = {
-                                "uuid": data.get("uuid", ""),
-                                "timestamp": data.get("timestamp", ""),
-                                "type": data.get("type", ""),
-                                "role": message_data.get("role", data.get("type", "")),
-                                "content": content
-                            }
-                            messages.append(processed_msg)
-                        except json.JSONDecodeError as e:
-                            print(f"Erro linha {line_num} em {file_path}: {e}")
-                            continue
+            # Mesmo arquivo (mtime/tamanho) que o cliente já tem: 304 sem ler nada
+            etag = f'W/"{st.st_mtime_ns}-{st.st_size}"'
+            if self._send_not_modified(etag):
+                return
+            
+            messages, message_count = _load_session_messages(file_path, st.st_mtime_ns, st.st_size)
             
             session_data = {
                 "session_id": session_id,
                 "directory": directory,
-                "message_count": len(messages),
-                "messages": messages[:50]  # Limitar a 50 mensagens para performance
+                "message_count": message_count
             }
             
+            if self.request_version != 'HTTP/1.1':
+                # Cliente HTTP/1.0 não aceita chunked: corpo único
+                session_data["messages"] = messages  # Limitado a SESSION_DETAIL_LIMIT mensagens
+                self._send_json(session_data, (('ETag', etag),))
+                return
+            
+            # Chunked: uma mensagem por chunk, sem montar o corpo inteiro em memória
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('ETag', etag)
             self.end_headers()
-            self.wfile.write(json.dumps(session_data, ensure_ascii=False).encode('utf-8'))
+            
+            # Cabeçalho do objeto sem o "}" final, seguido da abertura da lista
+            self._write_chunk(json_utils.dumps(session_data)[:-1] + b',"messages":[')
+            for index, message in enumerate(messages):
+                chunk = json_utils.dumps(message)
+                self._write_chunk(b',' + chunk if index else chunk)
+            self._write_chunk(b']}')
+            self.wfile.write(b'0\r\n\r\n')
         
         except Exception as e:
             self.send_error(500, f"Erro ao carregar sessão: {str(e)}")
     
+    def _send_not_modified(self, etag):
+        """Responde 304 se o If-None-Match do cliente corresponde ao ETag atual"""
+        if_none_match = self.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        # Lista de ETags separados por vírgula (ou "*")
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        if etag not in candidates and '*' not in candidates:
+            return False
+        
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        return True
+    
+    def _send_json(self, data, extra_headers=()):
+        """Responde 200 com o JSON serializado em bytes (orjson) e Content-Length"""
+        body = json_utils.dumps(data)
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in extra_headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _write_chunk(self, data):
+        """Escreve um chunk de Transfer-Encoding: chunked (data não vazio)"""
+        self.wfile.write(b"%x\r\n%b\r\n" % (len(data), data))
+    
     def delete_session(self, path):
         """Exclui uma sessão específica"""
         try:
-            # Extrair directory e session_id da URL
-            parts = path.strip('/').split('/')
-            if len(parts) < 4:  # api/session/directory/session_id
+            # Extrair e validar directory e session_id da URL
+            match = _SESSION_PATH_RE.fullmatch(path)
+            if not match:
                 self.send_error(400, "URL inválida")
                 return
             
-            directory = parts[2]
-            session_id = parts[3]
+            directory, session_id = match.groups()
             
-            file_path = CLAUDE_PROJECTS_PATH / directory / f"{session_id}.jsonl"
+            file_path = os.path.join(CLAUDE_PROJECTS_PATH, directory, f"{session_id}.jsonl")
             
-            if not file_path.exists():
+            # Apagar o arquivo físico (o próprio unlink indica se a sessão existe)
+            try:
+                os.unlink(file_path)
+            except FileNotFoundError:
                 self.send_error(404, f"Sessão não encontrada: {directory}/{session_id}")
                 return
             
-            # Apagar o arquivo físico
-            file_path.unlink()
+            # E o texto da conversa extraído pelo summarizer, se houver
+            get_session_summarizer().delete_conversation_cache(directory, session_id)
+            _invalidate_sessions_cache()
             
             # Resposta de sucesso
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            response = {"success": True, "message": f"Sessão {session_id} excluída com sucesso"}
-            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+            self._send_json({"success": True, "message": f"Sessão {session_id} excluída com sucesso"})
         
         except Exception as e:
             self.send_error(500, f"Erro ao excluir sessão: {str(e)}")
     
+    def _read_json_body(self):
+        """Lê e decodifica o corpo JSON (bytes direto no parser); None se vazio"""
+        content_length = int(self.headers.get('Content-Length', 0))
+        self._body_read = True
+        if content_length == 0:
+            return None
+        return json_utils.loads(self.rfile.read(content_length))
+    
     def handle_summarize_request(self):
         """Processa requisições de resumo de sessão"""
         try:
             # Lê dados do corpo da requisição POST
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length == 0:
+            request_data = self._read_json_body()
+            if request_data is None:
                 self.send_error(400, "Requisição vazia")
                 return
             
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
-            
             # Extrai parâmetros
             directory = request_data.get('directory', '').strip()
             session_id = request_data.get('session_id', '').strip()
@@ -828,6 +1256,9 @@ class ViewerHandler(BaseHTTPRequestHandler):
             if not directory or not session_id:
                 self.send_error(400, "Parâmetros directory e session_id são obrigatórios")
                 return
+            if not (_SAFE_NAME_RE.fullmatch(directory) and _SAFE_NAME_RE.fullmatch(session_id)):
+                self.send_error(400, "Parâmetros directory e session_id inválidos")
+                return
             
             # Validações
             valid_types = ['conciso', 'detalhado', 'bullet_points']
@@ -836,40 +1267,26 @@ class ViewerHandler(BaseHTTPRequestHandler):
             
             print(f"🎯 Resumo solicitado: {directory}/{session_id} (tipo: {summary_type})")
             
-            # Executa resumo de forma síncrona (adaptado para HTTP server simples)
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            # Executa o resumo no event loop compartilhado; requisições
+            # simultâneas da mesma sessão/tipo aguardam a mesma geração
+            summarizer = get_session_summarizer()
+            result = _run_async(
+                summarizer.generate_summary(directory, session_id, summary_type)
+            )
             
-            try:
-                summarizer = get_session_summarizer()
-                result = loop.run_until_complete(
-                    summarizer.generate_summary(directory, session_id, summary_type)
-                )
-                
-                # Salvar resumo automaticamente se foi bem-sucedido
-                if result.get("success"):
-                    storage = get_summary_storage()
-                    summary_id = storage.save_summary(directory, session_id, result)
-                    result["summary_id"] = summary_id
-                    print(f"📝 Resumo salvo com ID: {summary_id}")
-                
-            finally:
-                loop.close()
+            # Salvar resumo automaticamente se foi bem-sucedido
+            if result.get("success"):
+                storage = get_summary_storage()
+                summary_id = storage.save_summary(directory, session_id, result)
+                result["summary_id"] = summary_id
+                print(f"📝 Resumo salvo com ID: {summary_id}")
             
             # Resposta
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            
-            response_json = json.dumps(result, ensure_ascii=False)
-            self.wfile.write(response_json.encode('utf-8'))
+            self._send_json(result, _SUMMARIZE_CORS_HEADERS)
             
             print(f"✅ Resumo concluído para {directory}/{session_id}")
             
-        except json.JSONDecodeError:
+        except json_utils.JSONDecodeError:
             self.send_error(400, "JSON inválido")
         except Exception as e:
             print(f"❌ Erro ao processar resumo: {e}")
@@ -879,14 +1296,11 @@ class ViewerHandler(BaseHTTPRequestHandler):
         """Processa requisições de resumo com conteúdo customizado"""
         try:
             # Lê dados do corpo da requisição POST
-            content_length = int(self.headers.get('Content-Length', 0))
-            if content_length == 0:
+            request_data = self._read_json_body()
+            if request_data is None:
                 self.send_error(400, "Requisição vazia")
                 return
             
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
-            
             # Extrai parâmetros
             custom_content = request_data.get('custom_content', '').strip()
             summary_type = request_data.get('summary_type', 'conciso').strip()
@@ -903,31 +1317,17 @@ class ViewerHandler(BaseHTTPRequestHandler):
             print(f"🎯 Resumo customizado solicitado (tipo: {summary_type}, {len(custom_content)} chars)")
             
             # Executa resumo usando conteúdo customizado
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                summarizer = get_session_summarizer()
-                result = loop.run_until_complete(
-                    summarizer.generate_summary_from_content(custom_content, summary_type)
-                )
-            finally:
-                loop.close()
+            summarizer = get_session_summarizer()
+            result = _run_async(
+                summarizer.generate_summary_from_content(custom_content, summary_type)
+            )
             
             # Resposta
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            
-            response_json = json.dumps(result, ensure_ascii=False)
-            self.wfile.write(response_json.encode('utf-8'))
+            self._send_json(result, _SUMMARIZE_CORS_HEADERS)
             
             print(f"✅ Resumo customizado concluído ({len(result.get('summary', ''))} chars)")
             
-        except json.JSONDecodeError:
+        except json_utils.JSONDecodeError:
             self.send_error(400, "JSON inválido")
         except Exception as e:
             print(f"❌ Erro ao processar resumo customizado: {e}")
@@ -937,48 +1337,25 @@ class ViewerHandler(BaseHTTPRequestHandler):
         """Lista resumos com filtros opcionais"""
         try:
             # Parse query parameters
-            parsed_path = urlparse(self.path)
-            query_params = parse_qs(parsed_path.query)
+            query_params = parse_qs(self.query_string)
             
             # Parâmetros opcionais
             directory = query_params.get('directory', [None])[0]
             session_id = query_params.get('session_id', [None])[0] 
             limit = int(query_params.get('limit', [50])[0])
             
-            storage = get_summary_storage()
-            
-            if directory and session_id:
-                # Resumos específicos de uma sessão
-                summaries = storage.get_summaries_for_session(directory, session_id)
-                print(f"📋 Listando {len(summaries)} resumos para {directory}/{session_id}")
-            else:
-                # Todos os resumos do sistema
-                summaries = storage.get_all_summaries(limit)
-                print(f"📋 Listando {len(summaries)} resumos totais")
-            
-            # Adicionar estatísticas
-            stats = storage.get_storage_stats()
-            
-            response_data = {
-                "success": True,
-                "summaries": summaries,
-                "total_found": len(summaries),
-                "storage_stats": stats,
-                "filters_applied": {
-                    "directory": directory,
-                    "session_id": session_id,
-                    "limit": limit
-                }
-            }
+            payload, etag = _get_summaries_payload(directory, session_id, limit)
+            if self._send_not_modified(etag):
+                return
             
             # Resposta
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(payload)))
             self.end_headers()
-            
-            response_json = json.dumps(response_data, ensure_ascii=False)
-            self.wfile.write(response_json.encode('utf-8'))
+            self.wfile.write(payload)
             
         except Exception as e:
             print(f"❌ Erro ao listar resumos: {e}")
@@ -1001,58 +1378,84 @@ class ViewerHandler(BaseHTTPRequestHandler):
                 summary = storage.get_summary_by_id(summary_id)
                 
                 if summary:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    
-                    response_json = json.dumps(summary, ensure_ascii=False)
-                    self.wfile.write(response_json.encode('utf-8'))
+                    self._send_json(summary)
                     print(f"📄 Resumo {summary_id} retornado")
                 else:
                     self.send_error(404, f"Resumo {summary_id} não encontrado")
             
             elif self.command == 'DELETE':
                 # Extrair directory e session_id dos query params para delete
-                parsed_path = urlparse(self.path)
-                query_params = parse_qs(parsed_path.query)
+                query_params = parse_qs(self.query_string)
                 directory = query_params.get('directory', [None])[0]
                 session_id = query_params.get('session_id', [None])[0]
                 
                 if not directory or not session_id:
                     self.send_error(400, "Parâmetros directory e session_id são obrigatórios para delete")
                     return
+                if not (_SAFE_NAME_RE.fullmatch(directory) and _SAFE_NAME_RE.fullmatch(session_id)):
+                    self.send_error(400, "Parâmetros directory e session_id inválidos")
+                    return
                 
                 success = storage.delete_summary(directory, session_id, summary_id)
                 
                 if success:
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.send_header('Access-Control-Allow-Origin', '*')
-                    self.end_headers()
-                    
-                    response = {"success": True, "message": f"Resumo {summary_id} removido"}
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
+                    self._send_json({"success": True, "message": f"Resumo {summary_id} removido"})
                     print(f"🗑️ Resumo {summary_id} removido")
                 else:
                     self.send_error(404, f"Resumo {summary_id} não encontrado ou erro na remoção")
             
+            else:
+                self.send_error(405, "Método não suportado para /api/summaries/{id}")
+            
         except Exception as e:
             print(f"❌ Erro no handle de resumo específico: {e}")
             self.send_error(500, str(e))
     
     def do_OPTIONS(self):
         """Handle preflight CORS requests"""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+        # Resposta sempre igual: bytes prontos em uma única escrita
+        self.log_request(200)
+        self.wfile.write(_OPTIONS_RESPONSE)
+    
+    # Tabelas de rotas (definidas após os métodos que referenciam)
+    _GET_ROUTES = {
+        "/api/sessions": serve_sessions_list,
+        "/": serve_index,
+        "/api/summaries": handle_list_summaries_request,
+        "/favicon.ico": send_not_found,
+    }
+    _GET_PREFIX_ROUTES = (
+        ("/api/session/", serve_session_detail),
+        ("/api/summaries/", handle_summary_detail_request),
+    )
+    _POST_ROUTES = {
+        "/api/summarize": handle_summarize_request,
+        "/api/summarize-custom": handle_summarize_custom_request,
+        "/api/summaries": handle_list_summaries_request,
+    }
+    _POST_PREFIX_ROUTES = (
+        ("/api/summaries/", handle_summary_detail_request),
+    )
+    _DELETE_ROUTES = {}
+    _DELETE_PREFIX_ROUTES = (
+        ("/api/session/", delete_session),
+    )
+
+class ViewerHTTPServer(ThreadingHTTPServer):
+    """
+    Servidor HTTP do viewer: uma thread (daemon) por conexão, para que um
+    detalhe/resumo lento ou uma conexão keep-alive ociosa não trave as demais
+    
+    O limite de concorrência fica só nos resumos (VIEWER_MAX_SUMMARIES).
+    """
+    daemon_threads = True
+    # Backlog do listen(): absorve rajadas de conexões (padrão do socketserver é 5)
+    request_queue_size = 128
 
 def run_server(port=3041):
     """Inicia o servidor"""
     server_address = ('', port)
-    httpd = HTTPServer(server_address, ViewerHandler)
+    httpd = ViewerHTTPServer(server_address, ViewerHandler)
     
     print(f"🚀 Claude Session Viewer iniciado em http://localhost:{port}")
     print(f"📁 Buscando sessões em: {CLAUDE_PROJECTS_PATH}")
@@ -1062,7 +1465,8 @@ def run_server(port=3041):
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("\n🛑 Servidor parado")
-        httpd.shutdown()
+    finally:
+        httpd.server_close()
 
 if __name__ == "__main__":
     run_server(3044)
\ No newline at end of file
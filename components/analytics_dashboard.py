@@ -11,6 +11,8 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import requests
 
+from utils.session_files import CLAUDE_PROJECTS_PATH, count_sessions
+
 def render_analytics_dashboard(viewer_api_url: str = "http://localhost:3041"):
     """
     Renderiza dashboard completo de analytics
@@ -147,7 +149,8 @@ def render_overview_analytics(data: Dict):
     # Extrair horários das sessões
     hourly_activity = {}
     for session in sessions:
-        hour = session.get('last_interaction', '00:00')[:2]
+        modified_time = session.get('modified_time')
+        hour = datetime.fromtimestamp(modified_time).strftime('%H') if modified_time is not None else '00'
         hourly_activity[f"{hour}:00"] = hourly_activity.get(f"{hour}:00", 0) + 1
     
     if hourly_activity:
@@ -509,8 +512,7 @@ def get_system_status() -> Dict:
         status["main_api"] = False
     
     # Verificar arquivos
-    projects_path = Path("/home/suthub/.claude/projects")
-    status["projects_path"] = projects_path.exists()
+    status["projects_path"] = CLAUDE_PROJECTS_PATH.exists()
     
     # Claude SDK
     sdk_path = Path("/home/suthub/.claude/cc-sdk-chat/viewer-claude/backend/claude-sdk")
@@ -538,12 +540,8 @@ def run_system_diagnostic() -> List[str]:
     
     if status.get("projects_path"):
         # Contar sessões
-        projects_path = Path("/home/suthub/.claude/projects")
-        session_count = 0
         try:
-            for directory in projects_path.iterdir():
-                if directory.is_dir():
-                    session_count += len(list(directory.glob("*.jsonl")))
+            session_count = count_sessions()
             checks.append(f"✅ Sistema de arquivos: {session_count} sessões encontradas")
         except:
             checks.append("❌ Sistema de arquivos: Erro ao acessar sessões")
@@ -299,10 +299,10 @@ def create_diagnostic_report() -> str:
     
     # Verificar arquivos do sistema
     from pathlib import Path
+    from utils.session_files import CLAUDE_PROJECTS_PATH, count_sessions
     
-    claude_projects = Path("/home/suthub/.claude/projects")
-    if claude_projects.exists():
-        session_files = sum(len(list(d.glob("*.jsonl"))) for d in claude_projects.iterdir() if d.is_dir())
+    if CLAUDE_PROJECTS_PATH.exists():
+        session_files = count_sessions(CLAUDE_PROJECTS_PATH)
         checks.append(f"✅ Sistema de arquivos: {session_files} sessões encontradas")
     else:
         checks.append("❌ Sistema de arquivos: Diretório não encontrado")
@@ -12,6 +12,8 @@ from datetime import datetime
 from typing import List, Dict, Optional
 from pathlib import Path
 
+from utils.session_files import CLAUDE_PROJECTS_PATH
+
 def render_advanced_session_browser(viewer_api_url: str = "http://localhost:3041"):
     """
     Renderiza navegador de sessões com interface avançada
@@ -91,7 +93,7 @@ def render_session_list(sessions: List[Dict], viewer_api_url: str):
         
         session_options = []
         for session in display_sessions:
-            last_time = session.get('last_interaction', 'N/A')
+            last_time = format_last_interaction(session)
             directory_short = session['directory'].replace('-home-suthub--claude-', '')
             display_name = f"⏰ {last_time} | 📁 {directory_short} | 🆔 {session['session_id'][:8]}..."
             session_options.append((display_name, session))
@@ -127,11 +129,11 @@ def render_session_preview(session: Dict):
         
         <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 10px; margin-bottom: 15px;">
             <div><strong>📁 Projeto:</strong><br><code>{session['directory']}</code></div>
-            <div><strong>⏰ Última Atividade:</strong><br>{session.get('last_interaction', 'N/A')}</div>
+            <div><strong>⏰ Última Atividade:</strong><br>{format_last_interaction(session)}</div>
         </div>
         
         <div style="font-size: 12px; color: #666;">
-            <strong>📂 Arquivo:</strong> <code>{session.get('file_path', 'N/A')}</code>
+            <strong>📂 Arquivo:</strong> <code>{get_session_file_path(session)}</code>
         </div>
     </div>
     """, unsafe_allow_html=True)
@@ -167,7 +169,7 @@ def render_session_details(viewer_api_url: str):
     
     with col_info2:
         # Carregar estatísticas do arquivo .jsonl
-        file_path = Path(session.get('file_path', ''))
+        file_path = get_session_file_path(session)
         if file_path.exists():
             try:
                 with open(file_path, 'r') as f:
@@ -258,6 +260,17 @@ def get_sessions_from_api(viewer_api_url: str) -> List[Dict]:
         st.error(f"❌ Erro ao carregar sessões: {str(e)}")
     return []
 
+def format_last_interaction(session: Dict) -> str:
+    """Horário (HH:MM) da última interação a partir do modified_time da API"""
+    modified_time = session.get('modified_time')
+    if modified_time is None:
+        return 'N/A'
+    return datetime.fromtimestamp(modified_time).strftime('%H:%M')
+
+def get_session_file_path(session: Dict) -> Path:
+    """Path do .jsonl da sessão (a API não envia mais file_path; montado a partir de directory/session_id)"""
+    return CLAUDE_PROJECTS_PATH / session['directory'] / f"{session['session_id']}.jsonl"
+
 def delete_session_with_confirmation(session: Dict, viewer_api_url: str):
     """Exclui sessão com confirmação"""
     
@@ -378,7 +391,7 @@ def render_session_details(viewer_api_url: str):
         <h3 style="margin: 0 0 15px 0;">📄 {session['session_id']}</h3>
         <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 15px;">
             <div><strong>📁 Projeto:</strong><br>{session['directory']}</div>
-            <div><strong>⏰ Última Atividade:</strong><br>{session.get('last_interaction', 'N/A')}</div>
+            <div><strong>⏰ Última Atividade:</strong><br>{format_last_interaction(session)}</div>
         </div>
     </div>
     """, unsafe_allow_html=True)
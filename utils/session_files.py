@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Acesso local aos arquivos de sessão do Claude
+Usado pelos componentes para checagens que não passam pela API do viewer
+"""
+
+import os
+from pathlib import Path
+
+# Mesmo diretório de sessões lido pelo viewer (backend/viewer.py)
+CLAUDE_PROJECTS_PATH = Path("/home/suthub/.claude/projects")
+
+def count_sessions(projects_path: Path = CLAUDE_PROJECTS_PATH) -> int:
+    """Conta os .jsonl de sessão em <projects_path>/<diretório>/ (scandir, sem stat por arquivo)"""
+    count = 0
+    with os.scandir(projects_path) as entries:
+        for directory in entries:
+            if directory.is_dir():
+                with os.scandir(directory.path) as files:
+                    count += sum(1 for f in files if f.name.endswith(".jsonl"))
+    return count